@@ -0,0 +1,9 @@
+"""
+Benchmarks for sheets_db backend.
+
+Benchmarks are run from the project root as modules, for example::
+
+    python -m benchmarks.join
+
+benchmarks.suite runs all main cases and writes results to JSON file.
+"""
@@ -0,0 +1,74 @@
+"""
+Load of several sheets from local fake google API: get_tables versus
+aget_tables, fetching sheets concurrently. Max lag of event loop shows, how
+long it was blocked by the load.
+"""
+import argparse
+import asyncio
+import time
+
+from benchmarks import data
+from benchmarks import fake_sheets
+
+
+def spreadsheet(sheets, rows):
+    team = data.spreadsheet(rows, 0)['sheets'][0]
+    return {'sheets': [
+        dict(team, properties={'sheetId': i, 'title': f'Sheet {i}'})
+        for i in range(sheets)]}
+
+
+async def measure_lag(load):
+    """Run load in event loop, return its time and max lag of the loop."""
+    lag = 0
+    done = False
+
+    async def ticker():
+        nonlocal lag
+        while not done:
+            start = time.perf_counter()
+            await asyncio.sleep(0.001)
+            lag = max(lag, time.perf_counter() - start - 0.001)
+
+    task = asyncio.create_task(ticker())
+    await asyncio.sleep(0)
+    start = time.perf_counter()
+    await load()
+    spent = time.perf_counter() - start
+    done = True
+    await task
+    return spent, lag
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--sheets', type=int, default=8)
+    parser.add_argument('--rows', type=int, default=2000)
+    parser.add_argument('--latency', type=float, default=0.2)
+    parser.add_argument('--row-latency', type=float, default=0.00005)
+    args = parser.parse_args()
+    data.setup()
+    from django.core.cache import cache
+
+    httpd, url = fake_sheets.serve(
+        spreadsheet(args.sheets, args.rows), args.latency, args.row_latency)
+    connection = fake_sheets.connect(url=url)
+    names = [f'sheet {i}' for i in range(args.sheets)]
+
+    async def load_sync():
+        connection.get_tables(names)
+
+    async def load_async():
+        await connection.aget_tables(names)
+
+    loads = [('get_tables', load_sync), ('aget_tables', load_async)]
+    for title, load in loads:
+        cache.clear()
+        spent, lag = asyncio.run(measure_lag(load))
+        print(f'{title}: {args.sheets} sheets of {args.rows} rows '
+              f'{spent * 1000:.0f} ms, event loop lag {lag * 1000:.0f} ms')
+    httpd.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,51 @@
+"""
+Refresh of a big form responses sheet with a few new rows, fetched whole
+and as append-only table, from local fake google API.
+"""
+import argparse
+
+from benchmarks import data
+from benchmarks import fake_sheets
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--replies', type=int, default=100000)
+    parser.add_argument('--new', type=int, default=100)
+    parser.add_argument('--latency', type=float, default=0.0)
+    parser.add_argument(
+        '--row-latency', type=float, default=0.0,
+        help='latency of fake google API per returned row, seconds')
+    args = parser.parse_args()
+    data.setup()
+    from pm_viewer import models
+
+    spreadsheet = data.spreadsheet(1000, args.replies)
+    rows = spreadsheet['sheets'][1]['data'][0]['rowData']
+    new_rows = data.spreadsheet(
+        1000, args.new, seed=1)['sheets'][1]['data'][0]['rowData'][1:]
+    httpd, url = fake_sheets.serve(
+        spreadsheet, args.latency, args.row_latency)
+    connection = fake_sheets.connect(url=url)
+    table_name = models.eNPSReply._meta.db_table.lower()
+
+    def refresh():
+        rows.extend(new_rows)
+        table_map = connection._get_table_map()
+        for entry in table_map.values():
+            entry['expires'] = 0
+        connection._store_table_map(table_map)
+        table = connection.get_tables([table_name])[table_name]
+        # indexes are extended, not built again
+        table.get_index(1)
+
+    for title, append_only in [('whole', ()), ('append-only', {table_name})]:
+        connection.append_only = append_only
+        connection.get_tables([table_name])[table_name].get_index(1)
+        spent = data.timeit(refresh, repeat=3)
+        print(f'{title:>12}: {spent * 1000:8.1f} ms')
+    httpd.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,48 @@
+"""
+Cache payload size and cache hit latency of a table.
+
+Raw google response JSON, which was cached before, is compared to
+pre-decoded columnar tables cached now.
+"""
+import argparse
+import json
+
+from benchmarks import data
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rows', type=int, default=50000)
+    args = parser.parse_args()
+    data.setup()
+    from django.db import connections
+    from sheets_db.backend import connection
+
+    spreadsheet = data.spreadsheet(args.rows, args.rows)
+    sheet = spreadsheet['sheets'][0]
+
+    raw = json.dumps(sheet)
+    raw_time = data.timeit(
+        lambda: connection.Table.from_sheet(json.loads(raw)))
+    print(f'raw JSON:  {len(raw) / 2 ** 20:8.2f} MiB, '
+          f'hit {raw_time * 1000:8.1f} ms')
+
+    packed = connection.Table.from_sheet(sheet).dumps()
+    packed_time = data.timeit(lambda: connection.Table.loads(packed))
+    print(f'columnar:  {len(packed) / 2 ** 20:8.2f} MiB, '
+          f'hit {packed_time * 1000:8.1f} ms')
+
+    data.fill_cache(spreadsheet)
+    db = connections['default']
+    get_time = data.timeit(lambda: db.connection.get_tables(['team']))
+    print(f'get_tables local hit: {get_time * 1000:8.3f} ms')
+
+    def shared_hit():
+        db.connection.local_cache.clear()
+        db.connection.get_tables(['team'])
+    shared_time = data.timeit(shared_hit)
+    print(f'get_tables shared cache hit: {shared_time * 1000:8.3f} ms')
+
+
+if __name__ == '__main__':
+    main()
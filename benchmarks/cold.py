@@ -0,0 +1,37 @@
+"""
+Cold fetch of one sheet from local fake google API: table cache is cleared
+before every load, so every load requests google.
+"""
+import argparse
+
+from benchmarks import aload
+from benchmarks import data
+from benchmarks import fake_sheets
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rows', type=int, default=1000)
+    parser.add_argument('--latency', type=float, default=0.0)
+    parser.add_argument('--loads', type=int, default=10)
+    args = parser.parse_args()
+    data.setup()
+    from django.core.cache import cache
+
+    httpd, url = fake_sheets.serve(
+        aload.spreadsheet(1, args.rows), args.latency)
+    connection = fake_sheets.connect(url=url)
+
+    def load():
+        for _ in range(args.loads):
+            cache.clear()
+            connection.get_tables(['sheet 0'])
+
+    spent = data.timeit(load)
+    print(f'cold fetch of {args.rows} rows: '
+          f'{spent / args.loads * 1000:.1f} ms')
+    httpd.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,105 @@
+import os
+import random
+import time
+
+import django
+
+TEAMS = ['Core', 'Web core', 'Mobile', 'Data core', 'QA']
+TEAM_HEADER = [
+    'Команда', 'Имя', 'Почта', 'Позиция', 'Грейд', 'Оценка', 'Метка', 'ЗП',
+    'Таргет ЗП', 'Найм']
+ENPS_HEADER = [
+    'Отметка времени', 'Адрес электронной почты',
+    'Насколько ты счастлив/счастлива работать в компании?']
+
+
+def setup():
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'benchmarks.settings')
+    django.setup()
+
+
+def cell(value):
+    if value is None:
+        return {}
+    if isinstance(value, str):
+        return {
+            'effectiveValue': {'stringValue': value},
+            'formattedValue': value,
+        }
+    return {
+        'effectiveValue': {'numberValue': value},
+        'formattedValue': str(value),
+    }
+
+
+def sheet(sheet_id, title, header, rows):
+    row_data = [{'values': [cell(value) for value in header]}]
+    row_data.extend({'values': [cell(value) for value in row]} for row in rows)
+    return {
+        'properties': {'sheetId': sheet_id, 'title': title},
+        'data': [{'rowData': row_data}],
+    }
+
+
+def team_names(teams):
+    """Names of teams, every second generated team is core one."""
+    names = TEAMS[:teams]
+    for i in range(len(names), teams):
+        names.append(f'Team {i} core' if i % 2 else f'Team {i}')
+    return names
+
+
+def spreadsheet(members, replies, seed=0, teams=len(TEAMS), empty=0.0):
+    """
+    Synthetic spreadsheet shaped as pm_viewer models: members of given
+    number of teams and eNPS replies of random members. Empty is fraction
+    of members with empty optional cells: name, salary and hire date.
+    """
+    rnd = random.Random(seed)
+    names = team_names(teams)
+    team = []
+    for i in range(members):
+        row = [
+            rnd.choice(names), f'Member {i}', f'member{i}@example.com',
+            'Developer', 'Middle', '', '',
+            rnd.randint(50, 200) * 1000, rnd.randint(50, 250) * 1000,
+            rnd.randint(40000, 44000),
+        ]
+        # random is not drawn without empty cells, to keep old data sets
+        if empty and rnd.random() < empty:
+            row[1] = row[7] = row[9] = None
+        team.append(row)
+    enps = []
+    for _ in range(replies):
+        enps.append([
+            rnd.randint(40000, 44000),
+            f'member{rnd.randrange(members)}@example.com',
+            rnd.randint(0, 10),
+        ])
+    return {'sheets': [
+        sheet(1, 'Team', TEAM_HEADER, team),
+        sheet(2, 'Отзывы eNPS', ENPS_HEADER, enps),
+    ]}
+
+
+def fill_cache(data, alias='default'):
+    """Put spreadsheet data to cache, as if it was loaded from google."""
+    from django.db import connections
+    from sheets_db.backend import connection
+
+    db = connections[alias]
+    db.ensure_connection()
+    db.connection.store_tables([
+        connection.Table.from_sheet(table_data)
+        for table_data in data['sheets']])
+
+
+def timeit(func, repeat=3):
+    """Best of repeat runs, in seconds."""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        spent = time.perf_counter() - start
+        best = spent if best is None else min(best, spent)
+    return best
@@ -0,0 +1,44 @@
+"""
+Time of TeamMember queries filtering and ordering by hire date.
+
+Dates are stored in sheets as serial numbers, so every query has to
+convert them, unless converted column is cached with table data.
+"""
+import argparse
+import datetime
+
+from benchmarks import data
+
+
+def queries():
+    from pm_viewer import models
+
+    members = models.TeamMember.objects.values_list('id', 'hire_date')
+    return {
+        'year': lambda: list(members.filter(hire_date__year__gte=2015)),
+        'year_order': lambda: list(
+            members.filter(hire_date__year=2012).order_by('hire_date')),
+        'first': lambda: list(members.order_by('-hire_date')[:10]),
+        'range': lambda: list(members.filter(hire_date__range=(
+            datetime.date(2012, 1, 1), datetime.date(2013, 1, 1)))),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rows', type=int, default=100000)
+    args = parser.parse_args()
+    data.setup()
+
+    data.fill_cache(data.spreadsheet(args.rows, 0))
+    for name, query in queries().items():
+        try:
+            spent = data.timeit(query)
+        except Exception as e:
+            print(f'{name:>10}: failed with {e.__class__.__name__}')
+            continue
+        print(f'{name:>10}: {spent * 1000:10.1f} ms')
+
+
+if __name__ == '__main__':
+    main()
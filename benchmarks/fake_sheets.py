@@ -0,0 +1,100 @@
+"""
+Local fake of google sheets HTTP API, serving spreadsheets.get of a
+synthetic spreadsheet. Connection is pointed to it by API_ENDPOINT option.
+"""
+import gzip
+import json
+import re
+import threading
+import time
+from http import server
+from urllib import parse
+
+
+def get_range(sheet, a1_range):
+    """
+    Sheet limited to rows of A1 range: whole rows like 1:1 or cells like
+    A5:J. Columns are not limited.
+    """
+    match = re.match(r'[A-Z]*(\d+):[A-Z]*(\d*)$', a1_range)
+    start, end = int(match.group(1)), match.group(2)
+    rows = sheet['data'][0]['rowData']
+    rows = rows[start - 1:int(end) if end else None]
+    return {'startRow': start - 1, 'rowData': rows}
+
+
+def serve(spreadsheet, latency=0.0, row_latency=0.0):
+    """
+    Serve the spreadsheet in a background thread. Every response is delayed
+    by latency plus row_latency per returned row, like google does.
+    Return server and its URL.
+    """
+    sheets = {
+        sheet['properties']['title']: sheet
+        for sheet in spreadsheet['sheets']}
+
+    class Handler(server.BaseHTTPRequestHandler):
+        # keep connections alive, as google does
+        protocol_version = 'HTTP/1.1'
+
+        def do_GET(self):
+            url = parse.urlparse(self.path)
+            query = parse.parse_qs(url.query)
+            ranges = {}
+            for a1_range in query.get('ranges', []):
+                title, _, cells = a1_range.rpartition('!')
+                if not title:
+                    title, cells = cells, None
+                ranges.setdefault(
+                    title[1:-1].replace("''", "'"), []).append(cells)
+            if query.get('includeGridData') == ['true']:
+                result = []
+                for title in ranges or sheets:
+                    sheet = sheets[title]
+                    if None not in ranges.get(title, [None]):
+                        sheet = dict(sheet, data=[
+                            get_range(sheet, cells)
+                            for cells in ranges[title]])
+                    result.append(sheet)
+            else:
+                result = [
+                    {'properties': sheet['properties']}
+                    for sheet in sheets.values()]
+            rows = sum(
+                len(sheet['data'][0]['rowData']) for sheet in result
+                if 'data' in sheet)
+            time.sleep(latency + row_latency * rows)
+            body = json.dumps({'sheets': result}).encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            if 'gzip' in self.headers.get('Accept-Encoding', ''):
+                body = gzip.compress(body, 1)
+                self.send_header('Content-Encoding', 'gzip')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    httpd = server.ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    return httpd, f'http://127.0.0.1:{httpd.server_port}/'
+
+
+def connect(alias='default', url=None, transport=None):
+    """
+    Point the connection to the fake server, with dummy credentials.
+    Transport records or replays responses.
+    """
+    from django.db import connections
+    from google.oauth2.credentials import Credentials
+
+    db = connections[alias]
+    db.ensure_connection()
+    db.connection.api_endpoint = url
+    db.connection.transport = transport
+    db.connection.credentials = Credentials(token='fake')
+    db.connection.configured = True
+    return db.connection
@@ -0,0 +1,38 @@
+"""
+Filter throughput of TeamMember queries, in rows per second.
+"""
+import argparse
+
+from benchmarks import data
+
+
+def filters():
+    from django.db.models import F, Q
+
+    return {
+        'exact': Q(team='Core'),
+        'home': Q(
+            salary__lt=F('salary_target') - 30000,
+            hire_date__year__isnull=False,
+            team__iendswith='core'),
+        'or': Q(team='Core') | Q(salary__gt=150000),
+        'range': Q(salary__range=(80000, 120000)),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rows', type=int, default=100000)
+    args = parser.parse_args()
+    data.setup()
+    from pm_viewer import models
+
+    data.fill_cache(data.spreadsheet(args.rows, 0))
+    query = models.TeamMember.objects.values_list('id')
+    for name, condition in filters().items():
+        spent = data.timeit(lambda: list(query.filter(condition)))
+        print(f'{name:>8}: {args.rows / spent:12,.0f} rows/s')
+
+
+if __name__ == '__main__':
+    main()
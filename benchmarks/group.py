@@ -0,0 +1,41 @@
+"""
+Per-team dashboard: salary aggregates and eNPS reply counts of each team,
+as one GROUP BY query and as one query per team.
+"""
+import argparse
+
+from benchmarks import data
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--members', type=int, default=100000)
+    parser.add_argument('--replies', type=int, default=100000)
+    args = parser.parse_args()
+    data.setup()
+    from django.db.models import Avg, Count, Sum
+    from pm_viewer import models
+
+    data.fill_cache(data.spreadsheet(args.members, args.replies))
+    members = models.TeamMember.objects
+    aggregates = {
+        'salary': Sum('salary'),
+        'target': Avg('salary_target'),
+        'replies': Count('enps_replies__value'),
+    }
+
+    def grouped():
+        return list(members.values('team').annotate(**aggregates))
+
+    def per_team():
+        return [
+            members.filter(team=team).aggregate(**aggregates)
+            for team in data.TEAMS]
+
+    for name, query in [('group by', grouped), ('per team', per_team)]:
+        spent = data.timeit(query)
+        print(f'{name:>8}: {spent * 1000:10.1f} ms')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,45 @@
+"""
+Join cost of TeamMember -> eNPSReply aggregation.
+
+With hash join time grows linearly with members + replies, so doubling
+both sizes should roughly double the time, not quadruple it.
+"""
+import argparse
+
+from benchmarks import data
+
+SIZES = [
+    (1000, 10000),
+    (2000, 20000),
+    (5000, 50000),
+    (10000, 100000),
+]
+
+
+def run(members, replies):
+    from django.db.models import Min
+    from pm_viewer import models
+
+    data.fill_cache(data.spreadsheet(members, replies))
+    query = models.TeamMember.objects.annotate(
+        min_enps=Min('enps_replies__value'))
+    return data.timeit(lambda: list(query.all()), repeat=1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        '--size', nargs=2, type=int, action='append',
+        metavar=('MEMBERS', 'REPLIES'), help='sheet sizes to run')
+    args = parser.parse_args()
+    data.setup()
+    previous = None
+    for members, replies in args.size or SIZES:
+        spent = run(members, replies)
+        growth = f'x{spent / previous:.1f}' if previous else ''
+        print(f'{members:>7} x {replies:>7}: {spent:8.3f}s {growth}')
+        previous = spent
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,44 @@
+"""
+Time of point and range lookups of indexed TeamMember fields and eNPS
+replies by foreign key.
+"""
+import argparse
+import datetime
+
+from benchmarks import data
+
+
+def queries():
+    from pm_viewer import models
+
+    members = models.TeamMember.objects
+    replies = models.eNPSReply.objects
+    return {
+        'get_email': lambda: members.get(email='member777@example.com'),
+        'get_pk': lambda: members.get(pk=777),
+        'pk_range': lambda: list(members.filter(pk__range=(100, 200))),
+        'year': lambda: list(members.filter(hire_date__year=2012)),
+        'date_lt': lambda: list(members.filter(
+            hire_date__lt=datetime.date(2010, 1, 1))),
+        'fk': lambda: list(replies.filter(email='member777@example.com')),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rows', type=int, default=100000)
+    args = parser.parse_args()
+    data.setup()
+
+    data.fill_cache(data.spreadsheet(args.rows, args.rows))
+    for name, query in queries().items():
+        try:
+            spent = data.timeit(query)
+        except Exception as e:
+            print(f'{name:>10}: failed with {e.__class__.__name__}')
+            continue
+        print(f'{name:>10}: {spent * 1000:10.1f} ms')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,33 @@
+"""
+prefetch_related of eNPS replies for team members: one query with IN of
+all member emails against replies table.
+"""
+import argparse
+
+from benchmarks import data
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--members', type=int, default=5000)
+    parser.add_argument('--replies', type=int, default=50000)
+    args = parser.parse_args()
+    data.setup()
+    from django.db.models import prefetch_related_objects
+    from pm_viewer import models
+
+    data.fill_cache(data.spreadsheet(args.members, args.replies))
+    members = list(models.TeamMember.objects.all())
+
+    def prefetch():
+        for member in members:
+            member._prefetched_objects_cache = {}
+        prefetch_related_objects(members, 'enps_replies')
+
+    spent = data.timeit(prefetch)
+    print(f'{args.members} members, {args.replies} replies: '
+          f'{spent * 1000:.1f} ms')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,46 @@
+"""
+Repeated dashboard queries of the home page, without and with query
+results cache.
+"""
+import argparse
+
+from benchmarks import data
+
+
+def dashboard():
+    from django.db.models import F, Min
+    from pm_viewer import models
+
+    members = models.TeamMember.objects.filter(
+        salary__lt=F('salary_target') - 30000,
+        hire_date__year__isnull=False,
+        team__iendswith='core',
+    ).annotate(
+        dif=F('salary_target') - 30000,
+        count_enps=Min('enps_replies__value'),
+    ).order_by('-dif')
+    return len(list(members)), models.TeamMember.objects.count()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--members', type=int, default=5000)
+    parser.add_argument('--replies', type=int, default=50000)
+    args = parser.parse_args()
+    data.setup()
+    from django.db import connections
+    from sheets_db.backend import local_cache
+
+    data.fill_cache(data.spreadsheet(args.members, args.replies))
+    db = connections['default'].connection
+    result_cache = local_cache.get_cache(
+        'benchmark_results', float('inf'), 10 ** 6, 60 * 60)
+    for title, cache in [('no cache', None), ('results cache', result_cache)]:
+        db.result_cache = cache
+        spent = data.timeit(dashboard, repeat=10)
+        print(f'{title}: {spent * 1000:.1f} ms')
+    print(result_cache.stats())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,56 @@
+"""
+Django settings for benchmarks. Sheets are served from local memory cache,
+so no google credentials or redis are required.
+
+Set SHEETS_DB_VECTORIZED=1 environment variable to benchmark numpy engine,
+SHEETS_DB_RESULT_CACHE_ROWS to enable query results cache,
+SHEETS_DB_REDIS to URL of redis to use it as shared cache.
+"""
+import os
+
+SECRET_KEY = 'benchmarks'
+
+INSTALLED_APPS = [
+    'django.contrib.contenttypes',
+    'pm_viewer',
+]
+
+DATABASES = {
+    'default': {
+        'ENGINE': 'sheets_db.backend',
+        'NAME': 'benchmark',
+        'CACHE_TTL': 60 * 60,
+        'APP_SECRET': '',
+        'USER_SECRET': '',
+        'OPTIONS': {
+            'VECTORIZED': os.environ.get('SHEETS_DB_VECTORIZED') == '1',
+            'RESULT_CACHE_ROWS': int(
+                os.environ.get('SHEETS_DB_RESULT_CACHE_ROWS', 0)),
+        },
+    }
+}
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
+if os.environ.get('SHEETS_DB_REDIS'):
+    CACHES['default'] = {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': os.environ['SHEETS_DB_REDIS'],
+    }
+
+# Home view is rendered by benchmark suite
+ROOT_URLCONF = 'pm_viewer.urls'
+TEMPLATES = [
+    {
+        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        'APP_DIRS': True,
+    },
+]
+STATIC_URL = '/static/'
+
+USE_TZ = False
+
+DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
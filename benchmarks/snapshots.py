@@ -0,0 +1,39 @@
+"""
+Cold start of a worker: tables are loaded to empty local cache from shared
+cache or from on-disk snapshots.
+"""
+import argparse
+import tempfile
+
+from benchmarks import data
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--members', type=int, default=50000)
+    parser.add_argument('--replies', type=int, default=200000)
+    args = parser.parse_args()
+    data.setup()
+    from django.db import connections
+
+    db = connections['default']
+    db.ensure_connection()
+    connection = db.connection
+    with tempfile.TemporaryDirectory() as directory:
+        connection.snapshot_dir = directory
+        data.fill_cache(data.spreadsheet(args.members, args.replies))
+
+        for title, snapshot_dir in [
+                ('shared cache', None), ('snapshots', directory)]:
+            connection.snapshot_dir = snapshot_dir
+
+            def load():
+                connection.local_cache.clear()
+                connection.get_tables()
+
+            spent = data.timeit(load)
+            print(f'{title}: {spent * 1000:.1f} ms')
+
+
+if __name__ == '__main__':
+    main()
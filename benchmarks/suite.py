@@ -0,0 +1,173 @@
+"""
+Benchmark suite of the backend, writing results to JSON file to track
+regressions between commits.
+
+Synthetic spreadsheet is served by local fake google API, tables are cached
+in local memory cache, or in redis set by SHEETS_DB_REDIS. Every case is
+run repeat times, minimum, median and maximum times are reported::
+
+    python -m benchmarks.suite --members 10000 --replies 100000 \\
+        --output results.json --compare previous.json
+
+Responses recorded from real spreadsheet with RECORD_DIR database option
+are served instead of synthetic one by --replay option.
+"""
+import argparse
+import datetime
+import json
+import platform
+import statistics
+import subprocess
+import time
+
+import django
+
+from benchmarks import data
+from benchmarks import fake_sheets
+from sheets_db.backend import transport
+
+
+def get_cases(connection):
+    from django.core.cache import cache
+    from django.db.models import Avg, Count, F, Max, Min
+    from django.test import RequestFactory
+    from pm_viewer import models
+    from pm_viewer import views
+
+    members = models.TeamMember.objects
+    home = views.Home.as_view()
+    request = RequestFactory().get('/', HTTP_HOST='localhost')
+
+    def get_tables_miss():
+        cache.clear()
+        connection.local_cache.clear()
+        connection.get_tables()
+
+    def get_tables_shared_hit():
+        connection.local_cache.clear()
+        connection.get_tables()
+
+    return {
+        'get_tables_miss': get_tables_miss,
+        'get_tables_shared_hit': get_tables_shared_hit,
+        'get_tables_hit': connection.get_tables,
+        'filter': lambda: list(members.filter(
+            salary__lt=F('salary_target') - 30000,
+            team__iendswith='core').values_list('id')),
+        'filter_indexed': lambda: list(members.filter(
+            email='member1@example.com')),
+        'join': lambda: list(members.annotate(
+            min_enps=Min('enps_replies__value')).values_list(
+            'id', 'min_enps')),
+        'aggregate': lambda: list(members.values('team').annotate(
+            count=Count('id'), salary=Avg('salary'),
+            enps=Max('enps_replies__value'))),
+        'order_by': lambda: list(members.order_by('-salary', 'name')),
+        'order_by_limit': lambda: list(members.order_by('-salary')[:50]),
+        'home': lambda: home(request).render(),
+    }
+
+
+def measure(func, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return {
+        'min_ms': round(min(times) * 1000, 3),
+        'median_ms': round(statistics.median(times) * 1000, 3),
+        'max_ms': round(max(times) * 1000, 3),
+        'repeat': repeat,
+    }
+
+
+def get_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+            check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, path):
+    """Print ratio of median times to results of previous run."""
+    with open(path) as file:
+        previous = json.load(file)['results']
+    for name, result in results.items():
+        if name in previous:
+            ratio = result['median_ms'] / previous[name]['median_ms']
+            print(f'{name:>22}: x{ratio:.2f}')
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--members', type=int, default=10000)
+    parser.add_argument('--replies', type=int, default=100000)
+    parser.add_argument('--teams', type=int, default=len(data.TEAMS))
+    parser.add_argument(
+        '--empty', type=float, default=0.0,
+        help='fraction of members with empty optional cells')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument(
+        '--latency', type=float, default=0.0,
+        help='latency of fake google API, seconds')
+    parser.add_argument(
+        '--record', help='directory to record responses of fake API')
+    parser.add_argument(
+        '--replay', help='directory of recorded responses to serve')
+    parser.add_argument(
+        '--replay-latency', action='store_true',
+        help='delay replayed responses by recorded time')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument(
+        '--case', action='append', help='cases to run, all by default')
+    parser.add_argument('--output', help='JSON file of results')
+    parser.add_argument('--compare', help='JSON file of previous results')
+    args = parser.parse_args()
+    data.setup()
+    from django.conf import settings
+
+    httpd = url = None
+    if not args.replay:
+        spreadsheet = data.spreadsheet(
+            args.members, args.replies, args.seed, args.teams, args.empty)
+        httpd, url = fake_sheets.serve(spreadsheet, args.latency)
+    connection = fake_sheets.connect(
+        url=url, transport=transport.get_transport(
+            args.record, args.replay, args.replay_latency))
+    cases = get_cases(connection)
+    results = {}
+    try:
+        # tables are loaded once, so the first query case is not cold
+        connection.get_tables()
+        for name in args.case or cases:
+            results[name] = measure(cases[name], args.repeat)
+            print(f"{name:>22}: {results[name]['median_ms']:10.3f} ms")
+    finally:
+        if httpd is not None:
+            httpd.shutdown()
+    if args.compare:
+        compare(results, args.compare)
+    if args.output:
+        report = {
+            'commit': get_commit(),
+            'date': datetime.datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'cache': settings.CACHES['default']['BACKEND'],
+            'vectorized': connection.vectorized,
+            'parameters': {
+                name: value for name, value in vars(args).items()
+                if name not in ('output', 'compare')},
+            'results': results,
+        }
+        with open(args.output, 'w') as file:
+            json.dump(report, file, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,57 @@
+"""
+Phase timings of the dashboard queries, reported to connection.queries and
+metrics backend, and overhead of measuring them.
+"""
+import argparse
+import collections
+
+from benchmarks import data
+from benchmarks.results import dashboard
+from sheets_db.backend import metrics
+
+
+class Recorder(metrics.Metrics):
+    """Metrics backend summing reported values."""
+
+    def __init__(self):
+        self.values = collections.Counter()
+
+    def counter(self, name, value=1, tags=None):
+        self.values[name] += value
+
+    def histogram(self, name, value, tags=None):
+        self.values[name] += value
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--members', type=int, default=5000)
+    parser.add_argument('--replies', type=int, default=50000)
+    args = parser.parse_args()
+    data.setup()
+    from django.db import connections, reset_queries
+
+    data.fill_cache(data.spreadsheet(args.members, args.replies))
+    wrapper = connections['default']
+    wrapper.ensure_connection()
+    db = wrapper.connection
+    spent = data.timeit(dashboard, repeat=10)
+    print(f'dashboard: {spent * 1000:.1f} ms')
+
+    wrapper.force_debug_cursor = True
+    reset_queries()
+    dashboard()
+    for query in wrapper.queries:
+        print(f"{query['time']}s {query['sql']}")
+        print(f"    {query['timings']}")
+    wrapper.force_debug_cursor = False
+
+    recorder = db.metrics = Recorder()
+    spent = data.timeit(dashboard, repeat=10)
+    print(f'dashboard with metrics backend: {spent * 1000:.1f} ms')
+    for name, value in sorted(recorder.values.items()):
+        print(f'{name}: {value:.4g}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+"""
+bulk_create of team members: all rows are sent in one batchUpdate call and
+written through to the cached table, after check of the sheet in one get
+call.
+"""
+import argparse
+import datetime
+
+from benchmarks import data
+
+
+class FakeService:
+    """
+    Google sheets service of the spreadsheet in sync with the cache: header
+    row is returned for checks, rows after the last one are empty. Counts
+    API calls.
+    """
+    calls = 0
+    response = None
+
+    def __init__(self, spreadsheet):
+        self.spreadsheet = spreadsheet
+
+    def spreadsheets(self):
+        return self
+
+    def get(self, spreadsheetId, ranges, **kwargs):
+        sheets = {}
+        for sheet in self.spreadsheet['sheets']:
+            properties = sheet['properties']
+            title = "'" + properties['title'] + "'"
+            header = sheet['data'][0]['rowData'][:1]
+            grids = [
+                {'rowData': header} if a1_range == f'{title}!1:1' else {}
+                for a1_range in ranges if a1_range.startswith(title + '!')]
+            if grids:
+                sheets[title] = {'properties': properties, 'data': grids}
+        self.response = {'sheets': list(sheets.values())}
+        return self
+
+    def batchUpdate(self, spreadsheetId, body):
+        self.response = {}
+        return self
+
+    def execute(self):
+        FakeService.calls += 1
+        return self.response
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--members', type=int, default=5000)
+    parser.add_argument('--rows', type=int, default=1000)
+    args = parser.parse_args()
+    data.setup()
+    from django.db import connections
+    from pm_viewer import models
+
+    spreadsheet = data.spreadsheet(args.members, 0)
+    data.fill_cache(spreadsheet)
+    db = connections['default'].connection
+    db.configured = True
+    db._service = lambda *args, **kwargs: FakeService(spreadsheet)
+
+    def bulk_create():
+        models.TeamMember.objects.bulk_create([
+            models.TeamMember(
+                team='Core', name=f'New {i}', email=f'new{i}@example.com',
+                position='Developer', grade='Junior', evaluation='', mark='',
+                salary=50000, salary_target=60000,
+                hire_date=datetime.date(2022, 1, 1))
+            for i in range(args.rows)])
+
+    repeat = 3
+    spent = data.timeit(bulk_create, repeat)
+    print(f'bulk_create of {args.rows} rows: {spent * 1000:.1f} ms, '
+          f'{FakeService.calls / repeat:g} API calls per bulk_create, '
+          f'{models.TeamMember.objects.count()} rows after')
+
+
+if __name__ == '__main__':
+    main()
@@ -15,6 +15,7 @@ class TeamMember(models.Model):
 
     class Meta:
         db_table = 'Team'
+        indexes = [models.Index(fields=['hire_date'])]
 
 
 class eNPSReply(models.Model):
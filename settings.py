@@ -37,6 +37,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'sheets_db',
     'pm_viewer',
 ]
 
@@ -79,6 +80,7 @@ DATABASES = {
         'ENGINE': 'sheets_db.backend',
         'NAME': '19ZyiysCR9WBtECVYWF9sgGyXvk3xZK38rEfyk1a-l_E',
         'CACHE_TTL': 60 * 60,
+        'STALE_TTL': 24 * 60 * 60,
         'APP_SECRET': str(BASE_DIR / 'secrets.json'),
         'USER_SECRET': str(BASE_DIR / 'token.json'),
     }
@@ -12,11 +12,16 @@ from django.db.backends.base import base
 from django.db.backends.base.client import BaseDatabaseClient
 from django.db.backends.base.creation import BaseDatabaseCreation
 from django.db.backends.base.operations import BaseDatabaseOperations
-from django.db.backends.dummy.features import DummyDatabaseFeatures
+from django.db.backends import utils
 from django.db.backends.base.introspection import (
     BaseDatabaseIntrospection, FieldInfo, TableInfo,
 )
 from sheets_db.backend import connection
+from sheets_db.backend import indexes
+from sheets_db.backend.features import DummyDatabaseFeatures
+
+DEFAULT_LOCAL_CACHE_SIZE = 256 * 2 ** 20
+DEFAULT_LOCAL_CACHE_ROWS = 10 ** 6
 
 
 def complain(*args, **kwargs):
@@ -29,6 +34,7 @@ def ignore(*args, **kwargs):
 
 class DatabaseOperations(BaseDatabaseOperations):
     compiler_module = "sheets_db.backend.compiler"
+    explain_prefix = 'EXPLAIN'
 
     def quote_name(self, name):
         return name
@@ -36,6 +42,31 @@ class DatabaseOperations(BaseDatabaseOperations):
     def date_extract_sql(self, lookup_type, field_name):
         return field_name
 
+    def fetch_returned_insert_rows(self, cursor):
+        return cursor.fetchall()
+
+    def last_executed_query(self, cursor, sql, params):
+        return str(sql)
+
+    def explain_query_prefix(self, format=None, **options):
+        analyze = options.pop('analyze', False)
+        prefix = super().explain_query_prefix(format, **options)
+        return f'{prefix} ANALYZE' if analyze else prefix
+
+    # values are written to sheets as python objects, not as SQL literals
+    def adapt_datefield_value(self, value):
+        return value
+
+    def adapt_datetimefield_value(self, value):
+        return value
+
+    def adapt_timefield_value(self, value):
+        return value
+
+    def adapt_decimalfield_value(self, value, max_digits=None,
+                                 decimal_places=None):
+        return value
+
 
 class DatabaseClient(BaseDatabaseClient):
     def runshell(self, parameters):
@@ -69,11 +100,9 @@ class DatabaseIntrospection(BaseDatabaseIntrospection):
             FieldInfo(
                 field, "STRING", None, None, None, None, True, None, None,
             )
-            for field in table.fields
+            for field in table.field_names
         ]
 
-    get_indexes = complain
-
     def get_sequences(self, cursor, table_name, table_fields=()):
         """
         Return a list of introspected sequences for table_name. Each sequence
@@ -128,8 +157,39 @@ class DatabaseIntrospection(BaseDatabaseIntrospection):
 
         Some backends may return special constraint names that don't exist
         if they don't name constraints of a certain type (e.g. SQLite)
+
+        Sheets have no constraints, indexes are declared by models of the
+        table.
         """
-        return {}
+        constraints = {}
+        for model in indexes.get_table_models(table_name):
+            for field in model._meta.concrete_fields:
+                if not indexes.is_indexed(field):
+                    continue
+                name = f'{table_name}_{field.column}_idx'.lower()
+                constraints[name] = {
+                    'columns': [field.column],
+                    'primary_key': field.primary_key,
+                    'unique': field.unique,
+                    'foreign_key': None,
+                    'check': False,
+                    'index': True,
+                    'orders': ['ASC'],
+                    'type': 'idx',
+                }
+        return constraints
+
+
+class CursorDebugWrapper(utils.CursorDebugWrapper):
+    """
+    Link query log entry to the cursor, which adds timings of the query
+    phases to it when results are fetched.
+    """
+
+    def execute(self, sql, params=None):
+        result = super().execute(sql, params)
+        self.cursor.log_entry = self.db.queries_log[-1]
+        return result
 
 
 class DatabaseWrapper(base.BaseDatabaseWrapper):
@@ -140,13 +200,10 @@ class DatabaseWrapper(base.BaseDatabaseWrapper):
     # do something raises complain; anything that tries
     # to rollback or undo something raises ignore.
 
-    _commit = complain
-    _rollback = ignore
     _close = ignore
     _savepoint = ignore
     _savepoint_commit = complain
     _savepoint_rollback = ignore
-    _set_autocommit = ignore
     # Classes instantiated in __init__().
     client_class = DatabaseClient
     creation_class = DatabaseCreation
@@ -164,6 +221,29 @@ class DatabaseWrapper(base.BaseDatabaseWrapper):
         return {
             'NAME': self.settings_dict['NAME'],
             'CACHE_TTL': self.settings_dict['CACHE_TTL'],
+            'STALE_TTL': self.settings_dict.get('STALE_TTL', 0),
+            'VECTORIZED': self.settings_dict['OPTIONS'].get(
+                'VECTORIZED', False),
+            'API_ENDPOINT': self.settings_dict['OPTIONS'].get('API_ENDPOINT'),
+            # record or replay google API responses
+            'RECORD_DIR': self.settings_dict['OPTIONS'].get('RECORD_DIR'),
+            'REPLAY_DIR': self.settings_dict['OPTIONS'].get('REPLAY_DIR'),
+            'REPLAY_LATENCY': self.settings_dict['OPTIONS'].get(
+                'REPLAY_LATENCY', False),
+            'SNAPSHOT_DIR': self.settings_dict['OPTIONS'].get('SNAPSHOT_DIR'),
+            # tables refreshed by fetch of new rows only
+            'APPEND_ONLY_TABLES': self.settings_dict['OPTIONS'].get(
+                'APPEND_ONLY_TABLES', ()),
+            'METRICS': self.settings_dict['OPTIONS'].get('METRICS'),
+            'SLOW_QUERY_TIME': self.settings_dict['OPTIONS'].get(
+                'SLOW_QUERY_TIME'),
+            'LOCAL_CACHE_SIZE': self.settings_dict['OPTIONS'].get(
+                'LOCAL_CACHE_SIZE', DEFAULT_LOCAL_CACHE_SIZE),
+            'LOCAL_CACHE_ROWS': self.settings_dict['OPTIONS'].get(
+                'LOCAL_CACHE_ROWS', DEFAULT_LOCAL_CACHE_ROWS),
+            # query results cache is off by default
+            'RESULT_CACHE_ROWS': self.settings_dict['OPTIONS'].get(
+                'RESULT_CACHE_ROWS', 0),
             'APP_SECRET': str(self.settings_dict['APP_SECRET']),
             'USER_SECRET': str(self.settings_dict['USER_SECRET']),
             'ALIAS': self.alias,
@@ -180,3 +260,18 @@ class DatabaseWrapper(base.BaseDatabaseWrapper):
     def create_cursor(self, name=None):
         """Create a cursor. Assume that a connection is established."""
         return self.connection.cursor()
+
+    def make_debug_cursor(self, cursor):
+        return CursorDebugWrapper(cursor, self)
+
+    def _set_autocommit(self, autocommit):
+        # changes are sent at once in autocommit mode, on commit otherwise
+        self.connection.autocommit = autocommit
+
+    def _commit(self):
+        if self.connection is not None:
+            self.connection.commit()
+
+    def _rollback(self):
+        if self.connection is not None:
+            self.connection.rollback()
@@ -0,0 +1,160 @@
+"""
+Changes of sheet tables, gathered during a transaction.
+
+Row ids of all changes refer to the table snapshot, the transaction
+started with. On commit changes are sent to google as requests of one
+spreadsheets.batchUpdate call and applied to the snapshot, to put new
+table version to cache without refetch. Rows to update or delete are
+addressed by position and inserted rows are appended after the last one,
+so before the call they are checked to be the same in the sheet, as in the
+snapshot, and the row after the last one to be empty.
+"""
+from sheets_db.backend import converters
+
+
+class TableChanges:
+    table = None
+    # row id: {field number: value}
+    updates = None
+    deleted = None
+    # new rows as {field number: value}
+    inserted = None
+
+    def __init__(self, table):
+        self.table = table
+        self.updates = {}
+        self.deleted = set()
+        self.inserted = []
+
+    def __bool__(self):
+        return bool(self.updates or self.deleted or self.inserted)
+
+    def insert(self, rows):
+        """Append rows, return their ids."""
+        first = self.table.row_count - len(self.deleted) + len(self.inserted)
+        for row in rows:
+            self.inserted.append({
+                number: converters.to_cell(value)
+                for number, value in row.items()})
+        return list(range(first, first + len(rows)))
+
+    def update(self, row_id, values):
+        row = self.updates.setdefault(row_id, {})
+        for number, value in values.items():
+            row[number] = converters.to_cell(value)
+
+    def delete(self, row_ids):
+        self.deleted.update(row_ids)
+
+    def checked_rows(self):
+        """
+        [start, end) ranges of row ids to update or delete, and of the row
+        after the last one, which is empty if inserted rows get their ids.
+        """
+        row_ids = self.deleted.union(self.updates)
+        if self.inserted:
+            row_ids.add(self.table.row_count)
+        return get_ranges(sorted(row_ids))
+
+    def apply(self):
+        """New table snapshot with all changes."""
+        columns = []
+        for number, column in enumerate(self.table.columns):
+            column = list(column)
+            for row_id, values in self.updates.items():
+                if number in values:
+                    column[row_id] = values[number]
+            if self.deleted:
+                column = [
+                    value for row_id, value in enumerate(column)
+                    if row_id not in self.deleted]
+            column.extend(row.get(number) for row in self.inserted)
+            columns.append(tuple(column))
+        return self.table.__class__(
+            self.table.sheet_id, self.table.title, self.table.field_names,
+            tuple(columns))
+
+    def requests(self):
+        """
+        Requests of spreadsheets.batchUpdate. Updates go first, while row
+        ids still match sheet rows, then deletes from the last row.
+        """
+        requests = []
+        sheet_id = self.table.sheet_id
+        for rows, start, end in get_update_ranges(self.updates):
+            requests.append({'updateCells': {
+                'range': {
+                    'sheetId': sheet_id,
+                    # first sheet row is header
+                    'startRowIndex': rows[0] + 1,
+                    'endRowIndex': rows[-1] + 2,
+                    'startColumnIndex': start,
+                    'endColumnIndex': end,
+                },
+                'rows': [
+                    {'values': [
+                        get_cell(self.updates[row_id][number])
+                        for number in range(start, end)]}
+                    for row_id in rows],
+                'fields': 'userEnteredValue',
+            }})
+        for start, end in reversed(get_ranges(sorted(self.deleted))):
+            requests.append({'deleteDimension': {'range': {
+                'sheetId': sheet_id,
+                'dimension': 'ROWS',
+                'startIndex': start + 1,
+                'endIndex': end + 1,
+            }}})
+        if self.inserted:
+            width = len(self.table.field_names)
+            requests.append({'appendCells': {
+                'sheetId': sheet_id,
+                'rows': [
+                    {'values': [
+                        get_cell(row.get(number)) for number in range(width)]}
+                    for row in self.inserted],
+                'fields': 'userEnteredValue',
+            }})
+        return requests
+
+
+def get_cell(value):
+    """CellData of google API for the cell value."""
+    if value is None:
+        return {}
+    if isinstance(value, bool):
+        return {'userEnteredValue': {'boolValue': value}}
+    if isinstance(value, (int, float)):
+        return {'userEnteredValue': {'numberValue': value}}
+    return {'userEnteredValue': {'stringValue': value}}
+
+
+def get_ranges(numbers):
+    """Sorted numbers as list of [start, end) ranges of consecutive ones."""
+    ranges = []
+    for number in numbers:
+        if ranges and ranges[-1][1] == number:
+            ranges[-1][1] = number + 1
+        else:
+            ranges.append([number, number + 1])
+    return ranges
+
+
+def get_update_ranges(updates):
+    """
+    Split updated cells to rectangles: consecutive rows with the same
+    updated range of consecutive columns. Return list of (row ids, start
+    column, end column).
+    """
+    result = []
+    current = {}
+    for row_id in sorted(updates):
+        column_ranges = get_ranges(sorted(updates[row_id]))
+        for start, end in column_ranges:
+            rows = current.get((start, end))
+            if rows is not None and rows[-1] == row_id - 1:
+                rows.append(row_id)
+            else:
+                rows = current[start, end] = [row_id]
+                result.append((rows, start, end))
+    return result
@@ -1,8 +1,16 @@
 from django.core.exceptions import FieldError
-from django.db.models.expressions import Col
+from django.db.models.functions import Now, Random
+from django.db.models.lookups import Lookup
 from django.db.models.sql import compiler
+from django.db.models.sql.query import Query
+from django.db.models.sql.where import WhereNode
 from django.db import NotSupportedError
 from django.db.transaction import TransactionManagementError
+from django.utils import tree
+from django.utils.hashable import make_hashable
+
+# results of subqueries and of these functions are not cached
+NOT_CACHEABLE = (Query, Now, Random)
 
 
 class Selector:
@@ -15,6 +23,8 @@ class Selector:
     order_by = None
     group_by = None
     with_limit_offset = None
+    low_mark = 0
+    high_mark = None
     combinator = None
     distinct_fields = None
     having = None
@@ -25,8 +35,94 @@ class Selector:
         self.action = action
         self.compiler = compiler
 
+    def fingerprint(self):
+        """
+        Canonical hashable form of the query, equal for equal queries. None
+        if result of the query can't be cached.
+        """
+        if self.combinator or self.for_update or self.explain_info:
+            return None
+        parts = (self.where, self.having, self.columns, self.extra_select,
+                 self.order_by, self.group_by)
+        if not all(is_cacheable(part) for part in parts):
+            return None
+        tables = tuple(
+            (alias, table, getattr(table, 'join_type', None))
+            for alias, table in self.tables.items())
+        return make_hashable((
+            tables, self.columns, self.extra_select, self.where,
+            self.order_by, self.group_by, self.having, self.low_mark,
+            self.high_mark, self.distinct_fields))
+
+    @property
+    def table_name(self):
+        """Base table of the query."""
+        for table in (self.tables or {}).values():
+            return table.table_name
+        return None
+
+    def __str__(self):
+        tables = ', '.join(
+            table.table_name for table in (self.tables or {}).values())
+        result = f'{self.action} FROM {tables}'
+        if self.where:
+            result += f' WHERE {self.where}'
+        return result
+
+
+def is_cacheable(expression):
+    """Expression has no subqueries and gives the same result every time."""
+    if isinstance(expression, NOT_CACHEABLE):
+        return False
+    if isinstance(expression, (list, tuple)):
+        children = expression
+    elif isinstance(expression, tree.Node):
+        children = expression.children
+    elif isinstance(expression, Lookup):
+        children = (expression.lhs, expression.rhs)
+    elif hasattr(expression, 'get_source_expressions'):
+        children = expression.get_source_expressions()
+    else:
+        return True
+    return all(is_cacheable(child) for child in children)
+
+
+class Modifier:
+    """INSERT, UPDATE or DELETE statement."""
+    action = None
+    compiler = None
+    table = None
+    where = None
+    # INSERT column names and rows of values
+    columns = None
+    rows = None
+    # UPDATE list of (column name, value or expression)
+    values = None
+
+    def __init__(self, action, compiler):
+        self.action = action
+        self.compiler = compiler
+
+    @property
+    def table_name(self):
+        return self.table
+
+    def __str__(self):
+        result = f'{self.action} {self.table}'
+        if self.where:
+            result += f' WHERE {self.where}'
+        return result
+
 
 class SQLCompiler(compiler.SQLCompiler):
+    # expressions of GROUP BY, cursor groups rows by them
+    group_by_expressions = ()
+
+    def collapse_group_by(self, expressions, having):
+        expressions = super().collapse_group_by(expressions, having)
+        self.group_by_expressions = list(dict.fromkeys(expressions))
+        return expressions
+
     def as_sql(self, with_limits=True, with_col_aliases=False):
         """
         Create the SQL for this query. Return the SQL string and list of
@@ -41,10 +137,13 @@ class SQLCompiler(compiler.SQLCompiler):
             extra_select, order_by, group_by = self.pre_sql_setup()
             selector.extra_select = extra_select
             selector.order_by = order_by
-            selector.group_by = group_by
+            selector.group_by = self.group_by_expressions if group_by else []
             # Is a LIMIT/OFFSET clause needed?
             selector.with_limit_offset = with_limits and (
                     self.query.high_mark is not None or self.query.low_mark)
+            if selector.with_limit_offset:
+                selector.low_mark = self.query.low_mark
+                selector.high_mark = self.query.high_mark
             combinator = self.query.combinator
             features = self.connection.features
             if combinator:
@@ -57,8 +156,9 @@ class SQLCompiler(compiler.SQLCompiler):
                 # This must come after 'select', 'ordering', and 'distinct'
                 # (see docstring of get_from_clause() for details).
                 selector.tables = self.get_from_clause()
-                selector.where = self.where
-                selector.having = self.compile(self.having) if self.having is not None else ("", [])
+                # WHERE is None, if all conditions are moved to HAVING
+                selector.where = self.where or WhereNode()
+                selector.having = self.having
 
                 out_cols = []
                 col_idx = 1
@@ -121,11 +221,12 @@ class SQLCompiler(compiler.SQLCompiler):
                         selector.order_by = None
 
             selector.explain_info = self.query.explain_info
-            # if self.query.explain_info:
-            #     result.insert(0, self.connection.ops.explain_query_prefix(
-            #         self.query.explain_info.format,
-            #         **self.query.explain_info.options
-            #     ))
+            if self.query.explain_info:
+                # validates format and options, plan is built by cursor
+                self.connection.ops.explain_query_prefix(
+                    self.query.explain_info.format,
+                    **self.query.explain_info.options
+                )
 
             # if order_by:
             #     ordering = []
@@ -178,59 +279,59 @@ class SQLCompiler(compiler.SQLCompiler):
 
 
 class SQLInsertCompiler(compiler.SQLInsertCompiler, SQLCompiler):
-    pass
+    def as_sql(self):
+        """All rows are inserted by one statement."""
+        modifier = Modifier('INSERT', self)
+        modifier.table = self.query.get_meta().db_table
+        fields = self.query.fields
+        modifier.columns = [field.column for field in fields]
+        modifier.rows = [
+            [
+                self.prepare_value(field, self.pre_save_val(field, obj))
+                for field in fields
+            ]
+            for obj in self.query.objs
+        ]
+        return [(modifier, [])]
 
 
 class SQLDeleteCompiler(compiler.SQLDeleteCompiler, SQLCompiler):
     def as_sql(self):
-        # Prefer the non-standard DELETE FROM syntax over the SQL generated by
-        # the SQLDeleteCompiler's default implementation when multiple tables
-        # are involved since MySQL/MariaDB will generate a more efficient query
-        # plan than when using a subquery.
-        where, having = self.query.where.split_having()
-        if self.single_alias or having:
-            # DELETE FROM cannot be used when filtering against aggregates
-            # since it doesn't allow for GROUP BY and HAVING clauses.
-            return super().as_sql()
-        result = [
-            'DELETE %s FROM' % self.quote_name_unless_alias(
-                self.query.get_initial_alias()
-            )
-        ]
-        from_sql, from_params = self.get_from_clause()
-        result.extend(from_sql)
-        where_sql, where_params = self.compile(where)
-        if where_sql:
-            result.append('WHERE %s' % where_sql)
-        return ' '.join(result), tuple(from_params) + tuple(where_params)
+        modifier = Modifier('DELETE', self)
+        modifier.table = self.query.base_table
+        modifier.where = self.query.where
+        return modifier, ()
 
 
 class SQLUpdateCompiler(compiler.SQLUpdateCompiler, SQLCompiler):
     def as_sql(self):
-        update_query, update_params = super().as_sql()
-        # MySQL and MariaDB support UPDATE ... ORDER BY syntax.
-        if self.query.order_by:
-            order_by_sql = []
-            order_by_params = []
-            db_table = self.query.get_meta().db_table
-            try:
-                for resolved, (sql, params, _) in self.get_order_by():
-                    if (
-                        isinstance(resolved.expression, Col) and
-                        resolved.expression.alias != db_table
-                    ):
-                        # Ignore ordering if it contains joined fields, because
-                        # they cannot be used in the ORDER BY clause.
-                        raise FieldError
-                    order_by_sql.append(sql)
-                    order_by_params.extend(params)
-                update_query += ' ORDER BY ' + ', '.join(order_by_sql)
-                update_params += tuple(order_by_params)
-            except FieldError:
-                # Ignore ordering if it contains annotations, because they're
-                # removed in .update() and cannot be resolved.
-                pass
-        return update_query, update_params
+        self.pre_sql_setup()
+        if not self.query.values:
+            return '', ()
+        modifier = Modifier('UPDATE', self)
+        modifier.table = self.query.base_table
+        modifier.where = self.query.where
+        modifier.values = []
+        for field, model, val in self.query.values:
+            if hasattr(val, 'resolve_expression'):
+                val = val.resolve_expression(
+                    self.query, allow_joins=False, for_save=True)
+                if val.contains_aggregate:
+                    raise FieldError(
+                        f'Aggregate functions are not allowed in this query '
+                        f'({field.name}={val!r}).')
+            elif hasattr(val, 'prepare_database_save'):
+                if not field.remote_field:
+                    raise TypeError(
+                        f'Tried to update field {field} with a model '
+                        f'instance, {val!r}.')
+                val = field.get_db_prep_save(
+                    val.prepare_database_save(field),
+                    connection=self.connection)
+            else:
+                val = field.get_db_prep_save(val, connection=self.connection)
+            modifier.values.append((field.column, val))
+        return modifier, ()
 
 
 class SQLAggregateCompiler(compiler.SQLAggregateCompiler, SQLCompiler):
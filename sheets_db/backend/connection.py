@@ -1,28 +1,82 @@
+import asyncio
+import collections
 import logging
 import json
+import math
 import os
+import pickle
+import time
+import uuid
 
 from google.oauth2.credentials import Credentials
 from google.auth import exceptions
 from google.auth.transport.requests import Request
-from googleapiclient.discovery import build
+from googleapiclient import errors
 
+from asgiref.sync import sync_to_async
+from django.core import exceptions as dj_exceptions
 from django.core.cache import cache
 from django import db
 
+from sheets_db.backend import changes
+from sheets_db.backend import converters
 from sheets_db.backend import cursor
+from sheets_db.backend import local_cache
+from sheets_db.backend import metrics
+from sheets_db.backend import services
+from sheets_db.backend import snapshots
+from sheets_db.backend import transport
+from sheets_db.backend import vectorized
+
+try:
+    from redis.exceptions import RedisError
+except ImportError:
+    # redis is not used as cache
+    RedisError = OSError
 
 logger = logging.getLogger('sheets_db')
 
-CACHE_KEY_PREFIX = 'sheets_db_'
+# bump version on any change of cached tables format
+CACHE_VERSION = 3
+CACHE_KEY_PREFIX = f'sheets_db_v{CACHE_VERSION}_'
+PICKLE_PROTOCOL = 5
 TABLE_NAMES_SUFFIX = '_tables'
 TABLE_SUFFIX = '_table_'
+LOCK_SUFFIX = '_lock'
+RESULT_CACHE_SUFFIX = '_results'
+REFRESH_LOCK_TTL = 60
+REFRESH_WAIT_INTERVAL = 0.1
+# request only data, that is used by tables, skipping all formatting
+SHEETS_LIST_FIELDS = 'sheets.properties(sheetId,title)'
+SHEETS_DATA_FIELDS = (
+    'sheets(properties(sheetId,title),'
+    'data(rowData(values(effectiveValue,formattedValue))))')
+
+# process wide counters of cache events: refresh, stale_serve, lock_wait
+counters = collections.Counter()
 
 
 class Connection:
     settings = None
     credentials = None
     cache_key = None
+    result_cache = None
+    # root URL of google APIs, to use local fake server
+    api_endpoint = None
+    # directory of table snapshots, shared by workers of the host
+    snapshot_dir = None
+    # records or replays google API responses
+    transport = None
+    # names of tables, that only get new rows at the bottom
+    append_only = frozenset()
+    autocommit = True
+    # changes of current transaction by table name
+    changes = None
+    metrics = None
+    # queries longer than this number of seconds are logged
+    slow_query_time = None
+    # timings of query being executed
+    timings = None
 
     def __init__(self, settings):
         self.settings = settings
@@ -30,8 +84,35 @@ class Connection:
         self.cache_key = CACHE_KEY_PREFIX + self.name
         self.alias = self.settings['ALIAS']
         self.user_secret_file = self.settings['USER_SECRET']
-        self.configured = os.path.exists(self.user_secret_file)
+        self.transport = transport.get_transport(
+            self.settings.get('RECORD_DIR'), self.settings.get('REPLAY_DIR'),
+            self.settings.get('REPLAY_LATENCY'))
+        # replayed responses need no credentials
+        self.configured = os.path.exists(self.user_secret_file) or bool(
+            self.transport and self.transport.offline)
         self.cache_ttl = self.settings['CACHE_TTL']
+        self.vectorized = self.settings['VECTORIZED']
+        self.api_endpoint = self.settings.get('API_ENDPOINT')
+        self.snapshot_dir = self.settings.get('SNAPSHOT_DIR')
+        self.append_only = frozenset(
+            name.lower()
+            for name in self.settings.get('APPEND_ONLY_TABLES') or ())
+        self.metrics = metrics.get_backend(self.settings.get('METRICS'))
+        self.slow_query_time = self.settings.get('SLOW_QUERY_TIME')
+        if self.vectorized and vectorized.numpy is None:
+            raise dj_exceptions.ImproperlyConfigured(
+                'numpy is required for VECTORIZED sheets DB option')
+        # expired data is kept for STALE_TTL more to serve it while refresh
+        self.storage_ttl = self.cache_ttl + self.settings['STALE_TTL']
+        self.local_cache = local_cache.get_cache(
+            self.cache_key, self.settings['LOCAL_CACHE_SIZE'],
+            self.settings['LOCAL_CACHE_ROWS'], self.storage_ttl)
+        # results of queries, tagged with versions of their tables
+        if self.settings['RESULT_CACHE_ROWS']:
+            self.result_cache = local_cache.get_cache(
+                self.cache_key + RESULT_CACHE_SUFFIX, math.inf,
+                self.settings['RESULT_CACHE_ROWS'], self.storage_ttl)
+        self.changes = {}
 
     def refresh_credentials(self):
         if self.credentials.expired:
@@ -47,6 +128,9 @@ class Connection:
             logger.warning(
                 f"Sheets DB {self.alias} not configured.")
             return
+        if self.transport and self.transport.offline:
+            self.credentials = Credentials(token='replay')
+            return
         logger.warning("Load db credentials")
         self.credentials = Credentials.from_authorized_user_file(
             self.user_secret_file)
@@ -69,158 +153,841 @@ class Connection:
         with open(self.user_secret_file, 'tw') as token:
             token.write(credentials.to_json())
 
+    def get_changes(self, table_name):
+        """
+        Changes of the table in current transaction. Statements of the
+        transaction see the table as it was before the first change.
+        """
+        table_name = table_name.lower()
+        table_changes = self.changes.get(table_name)
+        if table_changes is None:
+            table = self.get_tables([table_name])[table_name]
+            table_changes = changes.TableChanges(table)
+            self.changes[table_name] = table_changes
+        return table_changes
+
+    def commit(self):
+        """
+        Send all changes of the transaction in one batchUpdate call, then
+        put changed tables to cache, so reads don't need refetch.
+        """
+        pending = [
+            table_changes for table_changes in self.changes.values()
+            if table_changes]
+        self.changes = {}
+        if not pending:
+            return
+        if not self.configured:
+            raise db.DatabaseError(f'Sheets DB {self.alias} not configured')
+        self._check_changes(pending)
+        requests = []
+        for table_changes in pending:
+            requests.extend(table_changes.requests())
+        logger.info(f'Writing {len(requests)} changes to google')
+        with self._phase('write'):
+            self._service().spreadsheets().batchUpdate(
+                spreadsheetId=self.name, body={'requests': requests},
+            ).execute()
+        self.store_tables(
+            [table_changes.apply() for table_changes in pending])
+
+    def rollback(self):
+        self.changes = {}
+
+    def _check_changes(self, pending):
+        """
+        Check header, rows to update or delete and absence of rows after
+        the last one in google, as changes are made on cached tables, which
+        could be stale. Tables changed since they were cached are fetched
+        again and the transaction fails.
+        """
+        checked = {
+            str(table_changes.table.sheet_id): table_changes
+            for table_changes in pending}
+        ranges = []
+        for table_changes in checked.values():
+            table = table_changes.table
+            title = quote_sheet_title(table.title)
+            last_column = get_column_letter(len(table.field_names) or 1)
+            ranges.append(f'{title}!1:1')
+            for start, end in table_changes.checked_rows():
+                # first sheet row is header
+                ranges.append(f'{title}!A{start + 2}:{last_column}{end + 1}')
+        with self._phase('fetch'):
+            data = self._get_data_request(
+                self._service().spreadsheets(), ranges).execute()
+        for table_data in data.get('sheets', []):
+            table_changes = checked.get(
+                str(table_data['properties']['sheetId']))
+            if table_changes is not None and table_changes.table.has_rows(
+                    table_data, table_changes.checked_rows()):
+                del checked[str(table_data['properties']['sheetId'])]
+        if checked:
+            changed = [
+                table_changes.table for table_changes in checked.values()]
+            logger.warning(f'{changed} changed in google, fetching them')
+            self.store_tables(
+                self._fetch_tables([table.title for table in changed]))
+            raise db.DatabaseError(
+                f'{changed} changed since they were read, retry transaction')
+
+    def _phase(self, name):
+        return metrics.Phase(self.timings, name)
+
+    def _count(self, event):
+        """Count cache event in process counters and metrics backend."""
+        counters[event] += 1
+        self.metrics.counter(
+            f'sheets_db.cache.{event}', 1, {'alias': self.alias})
+
+    def _service(self, name='sheets', version='v4'):
+        """Pooled service of current thread."""
+        self.refresh_credentials()
+        return services.get_service(
+            self.credentials, name, version, self.api_endpoint,
+            self.transport)
+
     def _get_table_map(self):
-        table_map = cache.get(self.cache_key + TABLE_NAMES_SUFFIX)
+        """
+        Return map of sheet id to sheet name, title and version of its
+        cached data. Version is None if sheet data was not loaded yet.
+        """
+        with self._phase('cache'):
+            table_map = cache.get(self.cache_key + TABLE_NAMES_SUFFIX)
         if table_map is not None:
-            table_map = json.loads(table_map)
+            with self._phase('decode'):
+                table_map = json.loads(table_map)
         return table_map
 
+    def _store_table_map(self, table_map):
+        cache.set(
+            self.cache_key + TABLE_NAMES_SUFFIX,
+            json.dumps(table_map), self.storage_ttl)
+
+    def _get_cached_table(self, table_id, version):
+        key = TABLE_SUFFIX + str(table_id)
+        table = self.local_cache.get(key, version)
+        if table is not None:
+            return table
+        data = None
+        if self.snapshot_dir:
+            with self._phase('cache'):
+                data = snapshots.read(
+                    self.snapshot_dir, self.cache_key + key, version)
+        if data is not None:
+            size = len(data)
+            with data, self._phase('decode'):
+                table = Table.loads(data)
+        else:
+            with self._phase('cache'):
+                data = cache.get(self.cache_key + key)
+            if not data:
+                return None
+            size = len(data)
+            with self._phase('decode'):
+                table = Table.loads(data)
+            if self.snapshot_dir:
+                with self._phase('cache'):
+                    snapshots.write(
+                        self.snapshot_dir, self.cache_key + key, version,
+                        data)
+        table.version = version
+        self.local_cache.set(key, version, table, size, table.row_count)
+        return table
+
+    def _get_snapshot_tables(self, table_names):
+        """Latest tables from snapshots, when shared cache is down."""
+        results = {}
+        for version, data in snapshots.read_latest(
+                self.snapshot_dir, self.cache_key + TABLE_SUFFIX):
+            with data:
+                table = Table.loads(data)
+            table.version = version
+            if not table_names or table.name in table_names:
+                results[table.name] = table
+        return results
+
     def get_table_names(self):
         table_map = self._get_table_map()
         if table_map is None:
             logger.info('Table map cache miss')
-        else:
-            return table_map.values()
-        return self.get_tables().keys()
+            if not self.configured:
+                return []
+            table_map = self._fetch_table_map()
+            self._store_table_map(table_map)
+        return [entry['name'] for entry in table_map.values()]
 
     def get_tables(self, table_names=None):
-        table_map = self._get_table_map()
         table_names = set(name.lower() for name in table_names or [])
-        if table_map:
-            results = {}
-            for table_id, table_name in table_map.items():
-                if not table_names or table_name in table_names:
-                    data = cache.get(
-                        self.cache_key + TABLE_SUFFIX + str(table_id))
-                    if not data:
-                        logger.info(
-                            f'Table {table_name}({table_id}) cache miss')
-                        break
-                    results[table_name] = Table(json.loads(data))
+        try:
+            lookup = self._lookup_tables(table_names)
+        except (OSError, RedisError) as e:
+            if not self.snapshot_dir:
+                raise
+            logger.warning(f'Cache not available, using snapshots: {e}')
+            return self._check_tables(
+                table_names, self._get_snapshot_tables(table_names))
+        if lookup is None:
+            return []
+        table_map, results, refresh, waiting = lookup
+        if refresh:
+            try:
+                tables = self._refresh_tables(refresh, table_map)
+            except Exception as e:
+                missing = self._refresh_failed(refresh, results, e)
+                for table_id in missing:
+                    self._unlock(table_id)
+                if missing:
+                    raise
             else:
-                for name in table_names:
-                    if name not in results:
-                        raise db.DatabaseError(f'{name} table not found in DB')
-                return results
-        # if table map cache miss or any table cache
-        if not self.configured:
+                for table in tables:
+                    results[table.name] = table
+                for table_id in refresh:
+                    self._unlock(table_id)
+        if waiting:
+            results.update(self._wait_tables(waiting))
+        return self._check_tables(table_names, results)
+
+    async def aget_tables(self, table_names=None):
+        """
+        get_tables for async code. Cache is read in worker thread, not to
+        block event loop, and tables to refresh are fetched concurrently,
+        one request per sheet.
+        """
+        table_names = set(name.lower() for name in table_names or [])
+        try:
+            lookup = await sync_to_async(
+                self._lookup_tables, thread_sensitive=False)(table_names)
+        except (OSError, RedisError) as e:
+            if not self.snapshot_dir:
+                raise
+            logger.warning(f'Cache not available, using snapshots: {e}')
+            return self._check_tables(
+                table_names, await sync_to_async(
+                    self._get_snapshot_tables, thread_sensitive=False)(
+                    table_names))
+        if lookup is None:
             return []
-        self.refresh_credentials()
-        logger.warning("Requesting google for DB data")
-        with build(
-                'sheets', 'v4', credentials=self.credentials) as service:
-            data = service.spreadsheets().get(
-                spreadsheetId=self.name, includeGridData=True
-            ).execute()
-        table_map = {}
+        table_map, results, refresh, waiting = lookup
+        if refresh:
+            try:
+                tables = await self._arefresh_tables(refresh, table_map)
+            except Exception as e:
+                missing = self._refresh_failed(refresh, results, e)
+                await self._aunlock(missing)
+                if missing:
+                    raise
+            else:
+                for table in tables:
+                    results[table.name] = table
+                await self._aunlock(refresh)
+        if waiting:
+            results.update(await sync_to_async(
+                self._wait_tables, thread_sensitive=False)(waiting))
+        return self._check_tables(table_names, results)
+
+    def _lookup_tables(self, table_names):
+        """
+        Find tables in cache and lock the ones to refresh. Return table map,
+        found tables by name, entries to refresh and entries to wait for,
+        refreshed by other worker. None if DB is not configured.
+        """
+        table_map = self._get_table_map()
+        if table_map is None:
+            logger.info('Table map cache miss')
+            if not self.configured:
+                return None
+            table_map = self._fetch_table_map()
+            self._store_table_map(table_map)
+        known_names = set(entry['name'] for entry in table_map.values())
+        if not table_names.issubset(known_names) and self.configured:
+            # sheets could be added after table map was cached
+            table_map = self._fetch_table_map(table_map)
+            self._store_table_map(table_map)
         results = {}
-        for table_data in data['sheets']:
-            table = Table(table_data)
-            table_map[table.sheet_id] = table.name
-            cache.set(
-                self.cache_key + TABLE_SUFFIX + str(table.sheet_id),
-                json.dumps(table_data), self.cache_ttl)
-            if not table_names or table.name in table_names:
-                results[table.name] = table
-        cache.set(
-            self.cache_key + TABLE_NAMES_SUFFIX,
-            json.dumps(table_map), self.cache_ttl)
+        stale = {}
+        missing = {}
+        now = time.time()
+        for table_id, entry in table_map.items():
+            if table_names and entry['name'] not in table_names:
+                continue
+            table = None
+            if entry['version'] is not None:
+                table = self._get_cached_table(table_id, entry['version'])
+            if table is None:
+                logger.info(f'Table {entry["name"]}({table_id}) cache miss')
+                missing[table_id] = entry
+            else:
+                results[entry['name']] = table
+                if entry['expires'] < now:
+                    stale[table_id] = entry
+        # only one worker refreshes a table, others serve stale data or
+        # wait for refreshed one if there is nothing to serve
+        refresh = {}
+        for table_id, entry in stale.items():
+            if self.configured and self._lock(table_id):
+                refresh[table_id] = entry
+            else:
+                self._count('stale_serve')
+        waiting = {}
+        for table_id, entry in missing.items():
+            if self._lock(table_id):
+                refresh[table_id] = entry
+            else:
+                waiting[table_id] = entry
+        if refresh and not self.configured:
+            for table_id in refresh:
+                self._unlock(table_id)
+            return None
+        return table_map, results, refresh, waiting
+
+    def _refresh_failed(self, entries, results, error):
+        """
+        Serve stale tables, when their refresh failed. Refresh lock of them
+        is kept till it expires, so google is not requested again by every
+        query. Return entries of tables without cached copy.
+        """
+        self._count('refresh_error')
+        missing = {
+            table_id: entry for table_id, entry in entries.items()
+            if entry['name'] not in results}
+        if not missing:
+            logger.warning(f'Refresh failed, serving stale tables: {error}')
+        return missing
+
+    @staticmethod
+    def _check_tables(table_names, results):
         for name in table_names:
             if name not in results:
                 raise db.DatabaseError(f'{name} table not found in DB')
+        return results
+
+    def _refresh_tables(self, entries, table_map):
+        self._count('refresh')
+        tables, entries = self._append_tables(entries)
+        if entries:
+            tables.extend(self._fetch_tables(
+                [entry['title'] for entry in entries.values()]))
+        self.store_tables(tables, table_map)
+        logger.warning("Database cache updated")
+        return tables
+
+    async def _arefresh_tables(self, entries, table_map):
+        self._count('refresh')
+        tables, entries = await sync_to_async(
+            self._append_tables, thread_sensitive=False)(entries)
+        if entries:
+            tables.extend(await self._afetch_tables(
+                [entry['title'] for entry in entries.values()]))
+        await sync_to_async(self.store_tables, thread_sensitive=False)(
+            tables, table_map)
         logger.warning("Database cache updated")
+        return tables
+
+    def _wait_tables(self, entries):
+        """Wait for tables, refreshed by other worker."""
+        self._count('lock_wait')
+        results = {}
+        table_map = None
+        deadline = time.monotonic() + REFRESH_LOCK_TTL
+        while entries and time.monotonic() < deadline:
+            # time of waiting for other worker is fetch time
+            with self._phase('fetch'):
+                time.sleep(REFRESH_WAIT_INTERVAL)
+            table_map = self._get_table_map() or {}
+            for table_id, entry in list(entries.items()):
+                new_entry = table_map.get(table_id)
+                if not new_entry or new_entry['version'] in (
+                        None, entry['version']):
+                    continue
+                table = self._get_cached_table(table_id, new_entry['version'])
+                if table is not None:
+                    results[table.name] = table
+                    del entries[table_id]
+        if entries and self.configured:
+            logger.warning(f'Refresh lock wait timeout for {entries}')
+            for table in self._refresh_tables(entries, table_map):
+                results[table.name] = table
         return results
 
+    def _lock_key(self, table_id):
+        return self.cache_key + TABLE_SUFFIX + str(table_id) + LOCK_SUFFIX
+
+    def _lock(self, table_id):
+        return cache.add(self._lock_key(table_id), True, REFRESH_LOCK_TTL)
+
+    def _unlock(self, table_id):
+        cache.delete(self._lock_key(table_id))
+
+    async def _aunlock(self, table_ids):
+        await asyncio.gather(*(
+            cache.adelete(self._lock_key(table_id))
+            for table_id in table_ids))
+
+    def _fetch_table_map(self, table_map=None):
+        """Request google for list of sheets, keeping known versions."""
+        table_map = table_map or {}
+        logger.warning("Requesting google for DB sheets")
+        with self._phase('fetch'):
+            data = self._service().spreadsheets().get(
+                spreadsheetId=self.name, fields=SHEETS_LIST_FIELDS,
+            ).execute()
+        result = {}
+        for table_data in data.get('sheets', []):
+            properties = table_data['properties']
+            table_id = str(properties['sheetId'])
+            old_entry = table_map.get(table_id)
+            if old_entry and old_entry['title'] == properties['title']:
+                result[table_id] = old_entry
+            else:
+                result[table_id] = {
+                    'name': properties['title'].lower(),
+                    'title': properties['title'],
+                    'version': None,
+                    'expires': None,
+                }
+        return result
+
+    def _fetch_tables(self, titles):
+        """Request google for data of given sheets only."""
+        logger.warning(f"Requesting google for DB data of {titles}")
+        with self._phase('fetch'):
+            data = self._get_data_request(
+                self._service().spreadsheets(),
+                [quote_sheet_title(title) for title in titles]).execute()
+        with self._phase('decode'):
+            return [
+                Table.from_sheet(table_data) for table_data in data['sheets']]
+
+    async def _afetch_tables(self, titles):
+        """
+        Request google for data of given sheets, one concurrent request per
+        sheet. Every request is sent in own thread by pooled service of the
+        thread, as http client of google API is not thread safe.
+        """
+        logger.warning(f"Requesting google for DB data of {titles}")
+        # refresh once, not in every thread
+        await sync_to_async(
+            self.refresh_credentials, thread_sensitive=False)()
+
+        def fetch(title):
+            data = self._get_data_request(
+                self._service().spreadsheets(),
+                [quote_sheet_title(title)]).execute()
+            return [
+                Table.from_sheet(table_data) for table_data in data['sheets']]
+
+        results = await asyncio.gather(*(
+            sync_to_async(fetch, thread_sensitive=False)(title)
+            for title in titles))
+        return [table for tables in results for table in tables]
+
+    def _get_data_request(self, spreadsheets, ranges):
+        return spreadsheets.get(
+            spreadsheetId=self.name, includeGridData=True, ranges=ranges,
+            fields=SHEETS_DATA_FIELDS,
+        )
+
+    def _append_tables(self, entries):
+        """
+        Fetch only new rows of append-only tables and append them to cached
+        tables. Header and the last known row of a table are fetched again,
+        if they are changed, the table is fetched whole. Return appended
+        tables and entries of tables to fetch whole.
+        """
+        appendable = {}
+        rest = {}
+        for table_id, entry in entries.items():
+            table = None
+            if entry['name'] in self.append_only and entry['version']:
+                table = self._get_cached_table(table_id, entry['version'])
+            if table is None:
+                rest[table_id] = entry
+            else:
+                appendable[table_id] = table
+        if not appendable:
+            return [], rest
+        ranges = []
+        for table_id, table in appendable.items():
+            title = quote_sheet_title(entries[table_id]['title'])
+            last_column = get_column_letter(len(table.field_names) or 1)
+            ranges.append(f'{title}!1:1')
+            # the last known row, header for empty table, and new rows
+            ranges.append(f'{title}!A{table.row_count + 1}:{last_column}')
+        logger.warning(
+            f'Requesting google for new rows of {list(appendable.values())}')
+        with self._phase('fetch'):
+            data = self._get_data_request(
+                self._service().spreadsheets(), ranges).execute()
+        tables = []
+        with self._phase('decode'):
+            for table_data in data.get('sheets', []):
+                table_id = str(table_data['properties']['sheetId'])
+                table = appendable.pop(table_id, None)
+                if table is None:
+                    continue
+                appended = table.append_sheet(table_data)
+                if appended is None:
+                    logger.warning(f'{table} is changed, fetching it whole')
+                    rest[table_id] = entries[table_id]
+                else:
+                    tables.append(appended)
+        for table_id in appendable:
+            rest[table_id] = entries[table_id]
+        return tables, rest
+
+    def store_tables(self, tables, table_map=None, modified=None):
+        """Put tables to cache with new versions and register in map."""
+        # take latest map, as other sheets could be refreshed meanwhile
+        table_map = self._get_table_map() or table_map or {}
+        for table in tables:
+            key = TABLE_SUFFIX + str(table.sheet_id)
+            entry = table_map.get(str(table.sheet_id))
+            if table.version is not None and entry and \
+                    entry['version'] == table.version:
+                # not changed table, cached data is prolonged
+                with self._phase('cache'):
+                    cache.touch(self.cache_key + key, self.storage_ttl)
+                entry['expires'] = time.time() + self.cache_ttl
+                entry['modified'] = modified
+                continue
+            version = table.version = uuid.uuid4().hex
+            with self._phase('cache'):
+                data = table.dumps()
+                cache.set(self.cache_key + key, data, self.storage_ttl)
+                if self.snapshot_dir:
+                    snapshots.write(
+                        self.snapshot_dir, self.cache_key + key, version,
+                        data)
+            self.local_cache.set(
+                key, version, table, len(data), table.row_count)
+            table_map[str(table.sheet_id)] = {
+                'name': table.name,
+                'title': table.title,
+                'version': version,
+                'expires': time.time() + self.cache_ttl,
+                'modified': modified,
+            }
+        # map is set last, so readers of new version get new tables
+        with self._phase('cache'):
+            self._store_table_map(table_map)
+
+    def get_modified_time(self):
+        """
+        Spreadsheet modification time from Drive, None if it is not
+        available, for example if credentials have no Drive scope or Drive
+        returned no time, then tables are refetched as changed.
+        """
+        try:
+            data = self._service('drive', 'v3').files().get(
+                fileId=self.name, fields='modifiedTime').execute()
+        except errors.HttpError as e:
+            logger.info(f'Spreadsheet modification time not available: {e}')
+            return None
+        return data.get('modifiedTime')
+
+    def refresh_expiring(self, ahead, load_all=False):
+        """
+        Refresh cached tables that expire in ahead seconds, so queries never
+        wait for google. Tables of not modified spreadsheet are prolonged
+        without refetch. Tables never loaded by queries are skipped, unless
+        load_all is set. Return number of refetched tables.
+        """
+        table_map = self._fetch_table_map(self._get_table_map())
+        deadline = time.time() + ahead
+        due = {}
+        for table_id, entry in table_map.items():
+            if entry['version'] is None and not load_all:
+                continue
+            if entry['expires'] is None or entry['expires'] < deadline:
+                if self._lock(table_id):
+                    due[table_id] = entry
+        if not due:
+            self._store_table_map(table_map)
+            return 0
+        try:
+            modified = self.get_modified_time()
+            refetch = {}
+            for table_id, entry in due.items():
+                if modified is None or entry.get('modified') != modified:
+                    refetch[table_id] = entry
+                    continue
+                cache.touch(
+                    self.cache_key + TABLE_SUFFIX + str(table_id),
+                    self.storage_ttl)
+                entry['expires'] = time.time() + self.cache_ttl
+            self._store_table_map(table_map)
+            if refetch:
+                self._count('refresh')
+                tables, entries = self._append_tables(refetch)
+                if entries:
+                    tables.extend(self._fetch_tables(
+                        [entry['title'] for entry in entries.values()]))
+                self.store_tables(tables, table_map, modified)
+        finally:
+            for table_id in due:
+                self._unlock(table_id)
+        return len(refetch)
+
+
+def quote_sheet_title(title):
+    """A1 notation range of the whole sheet."""
+    return "'" + title.replace("'", "''") + "'"
+
+
+def get_column_letter(number):
+    """A1 notation letters of column number, starting from 1."""
+    letters = ''
+    while number:
+        number, remainder = divmod(number - 1, 26)
+        letters = chr(ord('A') + remainder) + letters
+    return letters
+
 
 class Table:
-    properties = None
-    data = None
+    """
+    Decoded sheet data.
+
+    Data is stored by columns: one tuple of cell values for each field, so
+    it is decoded from google response only once and cached in flat form.
+    Table is immutable snapshot of sheet version, shared by all queries and
+    threads, scan state of a query is kept by its cursor.
+    """
+    sheet_id = None
+    title = None
+    name = None
     field_names = None
-    extra = None
-    row_id = -1
-    row_data = None
-    _cached = False
-    _cache = None
-
-    def __init__(self, data):
-        self.properties = data['properties']
-        self.sheet_id = data['properties']['sheetId']
-        self.name = data['properties']['title'].lower()
-        self.data = data['data'][0]['rowData']
-        self._init_fields()
-
-    @property
-    def cached(self):
-        return self._cached
-
-    @cached.setter
-    def cached(self, value):
-        if self.row_id != -1:
-            raise ValueError('Cached can be set only on start')
-        self._cached = value
-        if self._cached and self._cache is None:
-            self._cache = []
-
-    def flush(self):
-        if not self._cached:
-            raise ValueError('Can flush only cached tables')
-        self.row_id = -1
-
-    def _init_fields(self):
-        self.field_names = []
-        if not self.data:
-            return
-        for entry in self.data[0]['values']:
-            self.field_names.append(entry.get('formattedValue', None))
+    columns = None
+    row_count = 0
+    # version of table data in cache, set when table is cached
+    version = None
+    # data derived from columns, like arrays or indexes
+    derived = None
+
+    def __init__(self, sheet_id, title, field_names, columns):
+        self.sheet_id = sheet_id
+        self.title = title
+        self.name = title.lower()
+        self.field_names = field_names
+        self.columns = columns
+        self.row_count = len(columns[0]) if columns else 0
+        self.derived = {}
+
+    @classmethod
+    def from_sheet(cls, data):
+        """Decode sheet from google spreadsheets API response."""
+        properties = data['properties']
+        grid = data.get('data') or [{}]
+        rows = grid[0].get('rowData', [])
+        field_names = cls._get_header(rows)
+        columns = cls._get_columns(rows[1:], len(field_names))
+        return cls(
+            properties['sheetId'], properties['title'], field_names,
+            tuple(tuple(column) for column in columns))
 
-    def _get_field_value(self, data):
+    @staticmethod
+    def _get_header(rows):
+        if not rows:
+            return ()
+        return tuple(
+            entry.get('formattedValue', None)
+            for entry in rows[0].get('values', []))
+
+    @classmethod
+    def _get_columns(cls, rows, width):
+        """Decode rows of google response to lists of column values."""
+        columns = [[] for _ in range(width)]
+        for row in rows:
+            values = row.get('values', [])
+            for i, column in enumerate(columns):
+                value = values[i] if i < len(values) else {}
+                column.append(cls._get_field_value(
+                    value.get('effectiveValue', None)))
+        return columns
+
+    def append_sheet(self, data):
+        """
+        Table with new rows of the sheet appended. Data is response for
+        two ranges: header row and rows from the last row of the table.
+        None if header or the last row are changed, so the table is not
+        just appended.
+        """
+        grid = data.get('data') or []
+        if len(grid) != 2:
+            return None
+        header = self._get_header(grid[0].get('rowData', []))
+        rows = grid[1].get('rowData', [])
+        if header != self.field_names or not rows:
+            return None
+        columns = self._get_columns(rows, len(self.field_names))
+        if self.row_count and any(
+                column[0] != old[-1]
+                for column, old in zip(columns, self.columns)):
+            return None
+        # the first row is the last known one or header of empty table
+        return self.append([column[1:] for column in columns])
+
+    def has_rows(self, data, ranges):
+        """
+        Whether header and rows of [start, end) ranges of row ids are the
+        same in the sheet, rows after the last one are empty. Data is
+        response for header row and the ranges.
+        """
+        grid = data.get('data') or []
+        if len(grid) != len(ranges) + 1:
+            return False
+        header = self._get_header(grid[0].get('rowData', []))
+        if header != self.field_names:
+            return False
+        for (start, end), rows_data in zip(ranges, grid[1:]):
+            rows = rows_data.get('rowData', [])
+            # empty rows at the end are not returned
+            rows = rows + [{}] * (end - start - len(rows))
+            columns = self._get_columns(rows, len(self.field_names))
+            for column, old in zip(columns, self.columns):
+                old = old[start:end]
+                if tuple(column) != old + (None,) * (end - start - len(old)):
+                    return False
+        return True
+
+    def append(self, columns):
+        """
+        New table with rows of columns appended. Converted columns and
+        indexes of this table are extended, not built again. The table
+        itself if there are no new rows.
+        """
+        if not columns or not columns[0]:
+            return self
+        table = Table(
+            self.sheet_id, self.title, self.field_names,
+            tuple(old + tuple(new) for old, new in zip(
+                self.columns, columns)))
+        start, derived = self.row_count, table.derived
+        # copy, as queries of this table add derived data concurrently
+        derived_items = list(self.derived.items())
+        for key, column in derived_items:
+            if key[0] == 'typed':
+                _, number, kind = key
+                derived[key] = column + converters.convert(
+                    columns[number], kind)
+        for key, index in derived_items:
+            if key[0] == 'index':
+                _, number, kind = key
+                derived[key] = table._extend_index(index, number, kind, start)
+            elif key[0] == 'sorted' and index:
+                _, number, descending, kind = key
+                column = table.get_column(number, kind)
+                nulls, values = index
+                new = range(start, table.row_count)
+                values = values + [i for i in new if column[i] is not None]
+                try:
+                    # sort of sorted run and new rows is merge of them
+                    values.sort(key=column.__getitem__, reverse=descending)
+                except TypeError:
+                    continue
+                derived[key] = (
+                    nulls + [i for i in new if column[i] is None], values)
+        return table
+
+    def _extend_index(self, index, number, kind, start):
+        """Copy of hash index of rows before start with rows from it."""
+        index = dict(index)
+        copied = set()
+        column = self.get_column(number, kind)
+        for row_id in range(start, self.row_count):
+            value = column[row_id]
+            if value is None:
+                continue
+            if value not in copied:
+                # lists are shared with index of old table
+                index[value] = list(index.get(value, ()))
+                copied.add(value)
+            index[value].append(row_id)
+        return index
+
+    @classmethod
+    def loads(cls, data):
+        sheet_id, title, field_names, columns = pickle.loads(data)
+        return cls(sheet_id, title, field_names, columns)
+
+    def dumps(self):
+        return pickle.dumps(
+            (self.sheet_id, self.title, self.field_names, self.columns),
+            protocol=PICKLE_PROTOCOL)
+
+    @staticmethod
+    def _get_field_value(data):
         if data is None:
             return None
         if len(data) == 1:
             return list(data.values())[0]
         raise NotImplementedError('unknown data format')
 
-    def _read_row(self):
-        if self.row_id == -1:
-            # remove first row reserved for field names. It is kept there to
-            # not break caching
-            if self._cached:
-                self.row_id += 1
+    def get_column(self, number, kind=None):
+        """
+        Column values converted to the kind of model field, cached with
+        table data, so every table version is converted only once.
+        """
+        if kind is None:
+            return self.columns[number]
+        key = ('typed', number, kind)
+        column = self.derived.get(key)
+        if column is None:
+            column = self.derived[key] = converters.convert(
+                self.columns[number], kind)
+        return column
+
+    def get_index(self, number, kind=None):
+        """
+        Hash index of the column: row ids of every not NULL value, cached
+        with table data.
+        """
+        key = ('index', number, kind)
+        index = self.derived.get(key)
+        if index is None:
+            index = {}
+            for row_id, value in enumerate(self.get_column(number, kind)):
+                if value is not None:
+                    index.setdefault(value, []).append(row_id)
+            self.derived[key] = index
+        return index
+
+    def get_sorted_rows(self, number, descending=False, kind=None):
+        """
+        Row ids of NULLs and of values sorted by the column, cached with
+        table data. None if values of the column are not comparable.
+        """
+        key = ('sorted', number, descending, kind)
+        index = self.derived.get(key)
+        if index is None:
+            column = self.get_column(number, kind)
+            nulls = [i for i, value in enumerate(column) if value is None]
+            values = [i for i, value in enumerate(column) if value is not None]
+            try:
+                values.sort(key=column.__getitem__, reverse=descending)
+            except TypeError:
+                index = self.derived[key] = False
             else:
-                self.data.pop(0)
-        self.row_id += 1
-        row = self.data.pop(0)
-        self.row_data = [
-            self._get_field_value(value.get('effectiveValue', None))
-            for value in row['values']]
-        if self._cached:
-            self._cache.append(self.row_data)
-
-    def __iter__(self):
-        return self
-
-    def __next__(self):
-        if self.row_id is None:
-            raise StopIteration()
-        if self._cached and self.row_id + 1 < len(self._cache):
-            self.row_id += 1
-            self.row_data = self._cache[self.row_id]
-            return self.row_id
-        if not self.data:
-            self.row_id = None
-            self.row_data = None
-            raise StopIteration()
-        self._read_row()
-        return self.row_id
-
-    @property
-    def current_row(self):
-        if self.row_data is None:
-            raise db.DatabaseError('Cursor error')
-        return self.row_data
+                index = self.derived[key] = (nulls, values)
+        return index or None
+
+    def get_sorted_values(self, number, kind=None):
+        """
+        Not NULL values of the column in order of get_sorted_rows, to
+        search them by bisection. None if values are not comparable.
+        """
+        key = ('sorted_values', number, kind)
+        values = self.derived.get(key)
+        if values is None:
+            index = self.get_sorted_rows(number, kind=kind)
+            if index is None:
+                return None
+            column = self.get_column(number, kind)
+            values = self.derived[key] = [column[i] for i in index[1]]
+        return values
 
     def __str__(self):
-        return f'Table {self.name}({self.sheet_id})[{self.row_id}]'
+        return f'Table {self.name}({self.sheet_id})'
 
     def __repr__(self):
         return str(self)
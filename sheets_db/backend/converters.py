@@ -0,0 +1,91 @@
+"""
+Conversion of sheet cell values to python types of model fields and back.
+
+Columns are converted as a whole, once per table version, and cached with
+table data, so values are not parsed again on every access.
+"""
+import datetime
+import decimal
+
+from django.db import models
+
+# google sheets serial date number epoch
+SERIAL_EPOCH = datetime.datetime(1899, 12, 30)
+DATE_FORMAT = '%d.%m.%Y'
+BOOLEANS = {'true': True, 'false': False}
+
+
+def to_datetime(value):
+    if isinstance(value, str):
+        return datetime.datetime.strptime(value, DATE_FORMAT)
+    return SERIAL_EPOCH + datetime.timedelta(value)
+
+
+def to_date(value):
+    return to_datetime(value).date()
+
+
+def to_integer(value):
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    return value
+
+
+def to_decimal(value):
+    if isinstance(value, bool):
+        return value
+    if isinstance(value, float):
+        value = repr(value)
+    try:
+        return decimal.Decimal(value)
+    except (decimal.InvalidOperation, TypeError):
+        return value
+
+
+def to_boolean(value):
+    if isinstance(value, str):
+        return BOOLEANS.get(value.strip().lower(), value)
+    return bool(value)
+
+
+# order matters: more specific field classes go first
+CONVERTERS = (
+    (models.DateTimeField, 'datetime', to_datetime),
+    (models.DateField, 'date', to_date),
+    (models.DecimalField, 'decimal', to_decimal),
+    (models.BooleanField, 'boolean', to_boolean),
+    (models.IntegerField, 'integer', to_integer),
+)
+KINDS = {kind: converter for _, kind, converter in CONVERTERS}
+
+
+def to_cell(value):
+    """
+    Python value as sheet cell value, the same as it is read back from
+    google: dates are serial numbers.
+    """
+    if isinstance(value, datetime.datetime):
+        return (value - SERIAL_EPOCH).total_seconds() / 86400
+    if isinstance(value, datetime.date):
+        return (value - SERIAL_EPOCH.date()).days
+    if isinstance(value, decimal.Decimal):
+        return float(value)
+    if value is None or isinstance(value, (str, int, float)):
+        return value
+    return str(value)
+
+
+def get_kind(output_field):
+    """Name of conversion for the model field, None if not converted."""
+    for field_class, kind, _ in CONVERTERS:
+        if isinstance(output_field, field_class):
+            return kind
+    return None
+
+
+def convert(values, kind):
+    """Column values converted to kind, empty cells are NULL."""
+    converter = KINDS[kind]
+    return tuple(
+        None if value is None or value == '' else converter(value)
+        for value in values)
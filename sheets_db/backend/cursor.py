@@ -1,11 +1,70 @@
+import bisect
+import heapq
 import itertools
-import datetime
+import logging
 
 from django.db import DatabaseError
-from django.db import models
 from django.db.models.sql import datastructures
 
+from sheets_db.backend import converters
 from sheets_db.backend import expressions
+from sheets_db.backend import explain
+from sheets_db.backend import indexes
+from sheets_db.backend import metrics
+from sheets_db.backend import vectorized
+
+logger = logging.getLogger('sheets_db')
+
+
+class TableCursor:
+    """
+    Position of a query in a table. Tables are immutable snapshots shared by
+    all queries and threads, so scan state is kept here, per query.
+    """
+    table = None
+    row_id = None
+
+    def __init__(self, table):
+        self.table = table
+
+    @property
+    def name(self):
+        return self.table.name
+
+    @property
+    def field_names(self):
+        return self.table.field_names
+
+    @property
+    def row_count(self):
+        return self.table.row_count
+
+    @property
+    def derived(self):
+        return self.table.derived
+
+    def get_column(self, number, kind=None):
+        return self.table.get_column(number, kind)
+
+    def get_sorted_rows(self, number, descending=False, kind=None):
+        return self.table.get_sorted_rows(number, descending, kind)
+
+    def get_index(self, number, kind=None):
+        return self.table.get_index(number, kind)
+
+    def get_sorted_values(self, number, kind=None):
+        return self.table.get_sorted_values(number, kind)
+
+    def seek(self, row_id):
+        self.row_id = row_id
+
+    def get_value(self, number, kind=None):
+        if self.row_id is None:
+            raise DatabaseError('Cursor error')
+        return self.table.get_column(number, kind)[self.row_id]
+
+    def __str__(self):
+        return f'Cursor of {self.table}[{self.row_id}]'
 
 
 class BaseField:
@@ -22,6 +81,12 @@ class BaseField:
     def value(self):
         raise NotImplemented()
 
+    def compile(self):
+        """
+        Return function of base table row id, returning field value.
+        """
+        return lambda row_id: self.value
+
     def __str__(self):
         return f'Cursor field {self.alias}'
 
@@ -29,6 +94,8 @@ class BaseField:
 class CursorField(BaseField):
     table = None
     number = None
+    # conversion of cell values to type of model field
+    kind = None
 
     def __init__(self, cursor, alias, column):
         super(CursorField, self).__init__(cursor, alias, column)
@@ -40,6 +107,8 @@ class CursorField(BaseField):
         if self.name == 'id':
             self.number = -1
             return
+        if column is not None:
+            self.kind = converters.get_kind(column.output_field)
         for i, field_name in enumerate(self.table.field_names):
             if field_name.lower() == self.name:
                 self.number = i
@@ -52,15 +121,79 @@ class CursorField(BaseField):
     def value(self):
         if self.number == -1:  # id field
             return self.table.row_id
-        value = self.table.current_row[self.number]
-        if value and self.column and isinstance(
-                self.column.output_field, models.DateField):
-            if isinstance(value, str):
-                value = datetime.datetime.strptime(value, '%d.%m.%Y')
-            else:
-                value = datetime.datetime(1899, 12, 30) + datetime.timedelta(
-                    value)
-        return value
+        return self.table.get_value(self.number, self.kind)
+
+    @property
+    def is_indexed(self):
+        """Model field is indexed, so lookups are answered by indexes."""
+        if self.number == -1:
+            return True
+        target = getattr(self.column, 'target', None)
+        return target is not None and indexes.is_indexed(target)
+
+    def probe(self, values):
+        """Sorted row ids of the table with field value in values."""
+        if self.number == -1:
+            row_count = self.table.row_count
+            return sorted(
+                value for value in values
+                if isinstance(value, int) and 0 <= value < row_count)
+        index = self.table.get_index(self.number, self.kind)
+        rows = []
+        for value in values:
+            rows.extend(index.get(value, ()))
+        rows.sort()
+        return rows
+
+    def probe_range(self, low, high, include_low=True, include_high=True):
+        """
+        Sorted row ids of the table with field value between low and high,
+        None for no bound. None if values are not comparable to bounds.
+        """
+        if self.number == -1:
+            rows = values = range(self.table.row_count)
+        else:
+            values = self.table.get_sorted_values(self.number, self.kind)
+            if values is None:
+                return None
+            rows = self.table.get_sorted_rows(self.number, kind=self.kind)[1]
+        try:
+            start, end = 0, len(values)
+            if low is not None:
+                bisect_low = bisect.bisect_left if include_low \
+                    else bisect.bisect_right
+                start = bisect_low(values, low)
+            if high is not None:
+                bisect_high = bisect.bisect_right if include_high \
+                    else bisect.bisect_left
+                end = bisect_high(values, high)
+        except TypeError:
+            return None
+        if self.number == -1:
+            return rows[start:end]
+        return sorted(rows[start:end])
+
+    def get_values(self):
+        """Field values for all rows of the table."""
+        if self.number == -1:
+            return range(self.table.row_count)
+        return self.table.get_column(self.number, self.kind)
+
+    def compile(self):
+        if self.table is not self.cursor.base_table:
+            return super(CursorField, self).compile()
+        return self.get_values().__getitem__
+
+    def vectorize(self, table=None):
+        """
+        Field values as vector for all rows of the table, base table by
+        default.
+        """
+        if self.table is not (table or self.cursor.base_table):
+            raise vectorized.NotVectorizable(f'{self} of joined table')
+        if self.number == -1:
+            return vectorized.row_ids(self.table)
+        return vectorized.get_column(self.table, self.number, self.kind)
 
 
 class EvaluatedField(BaseField):
@@ -74,8 +207,19 @@ class EvaluatedField(BaseField):
     def value(self):
         return self.expression.evaluate()
 
+    def compile(self):
+        return self.expression.compile()
+
 
 class JoinCondition(expressions.BaseNode):
+    """
+    Hash join of the joined table to the current row of the parent table.
+
+    Joined table is scanned only once per query to build index on join
+    columns, after that every parent row just probes the index.
+    """
+    index = None
+
     def __init__(self, node, cursor):
         super(JoinCondition, self).__init__(node, cursor)
         self.table = cursor.tables[node.table_alias.lower()]
@@ -91,15 +235,36 @@ class JoinCondition(expressions.BaseNode):
     def evaluate(self):
         return all([f1.value == f2.value for f1, f2 in self.columns])
 
-    def __iter__(self):
-        self.table.flush()
-        return self
-
-    def __next__(self):
-        while True:
-            result = next(self.table)
-            if self.evaluate():
-                return result
+    def build_index(self):
+        self.index = {}
+        keys = zip(*(f2.get_values() for _, f2 in self.columns))
+        for row_id, key in enumerate(keys):
+            # NULL never equals anything in join condition
+            if None not in key:
+                self.index.setdefault(key, []).append(row_id)
+
+    def compile_probe(self):
+        """
+        Return function of parent table row id, returning row ids of the
+        joined table matching it.
+        """
+        if self.index is None:
+            with self.cursor.timings.phase('join'):
+                self.build_index()
+        index = self.index
+        getters = [f1.compile() for f1, _ in self.columns]
+        if len(getters) == 1:
+            getter = getters[0]
+            return lambda row_id: index.get((getter(row_id),), ())
+        return lambda row_id: index.get(
+            tuple(getter(row_id) for getter in getters), ())
+
+    def explain(self):
+        columns = ', '.join(
+            f'{f1.alias} = {f2.alias}' for f1, f2 in self.columns)
+        return explain.PlanNode(
+            f'Hash join {self.table.name}',
+            f'{self.node.join_type} on {columns}', self.table.row_count)
 
 
 class Cursor:
@@ -107,13 +272,36 @@ class Cursor:
     tables = None
     connection = None
     selector = None
-    fields_map = {}
+    fields_map = None
+    aggregations = None
+    # number of current group of aggregation query
+    group = None
     condition = None
     _base_table = None
+    _rows = None
+    _results = None
+    _ordering = None
+    _presorted = False
+    _grouped = False
+    _group_key = None
+    _having = None
+    _where = None
+    # number of rows to scan, known before scan
+    _candidates = None
+    _vectorized_filter = False
+    _group_count = None
     joins = None
+    # rows changed by INSERT, UPDATE or DELETE
+    rowcount = -1
+    timings = None
+    # entry of connection.queries in debug mode, set by debug wrapper
+    log_entry = None
+    _reported = True
 
     def __init__(self, connection):
         self.connection = connection
+        self.fields_map = {}
+        self.aggregations = []
 
     def __enter__(self):
         return self
@@ -123,6 +311,7 @@ class Cursor:
         return False
 
     def close(self):
+        self._report()
         self.tables = None
         self.fields = None
         self.fields_map = None
@@ -130,19 +319,92 @@ class Cursor:
         self.selector = None
 
     def execute(self, sql, params):
-        if sql.action == 'SELECT':
-            return self._execute_select(sql)
-        raise NotImplementedError('WTF')
-
-    def get_or_create_field(self, alias):
+        self._report()
+        self.timings = metrics.Timings()
+        self.statement = sql
+        self._reported = False
+        self.connection.timings = self.timings
+        try:
+            with self.timings.phase('plan'):
+                if sql.action == 'SELECT':
+                    return self._execute_select(sql)
+                if sql.action == 'INSERT':
+                    self._execute_insert(sql)
+                elif sql.action == 'UPDATE':
+                    self._execute_update(sql)
+                elif sql.action == 'DELETE':
+                    self._execute_delete(sql)
+                else:
+                    raise NotImplementedError(
+                        f'{sql.action} not implemented')
+                if self.connection.autocommit:
+                    self.connection.commit()
+        finally:
+            self.connection.timings = None
+
+    def _report(self):
+        """
+        Report timings of finished query to metrics backend, slow query log
+        and connection.queries.
+        """
+        if self._reported:
+            return
+        self._reported = True
+        timings = self.timings
+        total = timings.total
+        statement = self.statement
+        metrics.report(self.connection.metrics, timings, {
+            'alias': self.connection.alias,
+            'action': statement.action,
+            'table': statement.table_name,
+        })
+        slow_query_time = self.connection.slow_query_time
+        if slow_query_time is not None and total >= slow_query_time:
+            logger.warning(
+                f'Slow query {total:.3f}s: {statement} ({timings})')
+        if self.log_entry is not None:
+            self.log_entry['time'] = f'{total:.3f}'
+            self.log_entry['timings'] = timings.as_dict()
+            self.log_entry = None
+
+    def get_or_create_field(self, alias, column=None):
         alias = alias.lower()
         if alias in self.fields_map:
             return self.fields_map[alias]
-        return CursorField(self, alias, None)
+        return CursorField(self, alias, column)
 
     def _execute_select(self, selector):
         self.selector = selector
-        self.tables = self.connection.get_tables(selector.tables.keys())
+        tables = self.connection.get_tables(selector.tables.keys())
+        if selector.explain_info:
+            self._select(selector, tables)
+            self._results = iter(self._explain(selector.explain_info))
+            return
+        result_cache = self.connection.result_cache
+        key = None
+        if result_cache is not None:
+            key = selector.fingerprint()
+            versions = tuple(sorted(
+                (name, table.version) for name, table in tables.items()))
+        if key is None or any(version is None for _, version in versions):
+            self._select(selector, tables)
+            return
+        with self.timings.phase('cache'):
+            rows = result_cache.get(key, versions)
+        if rows is None:
+            # all rows are fetched at once, as fetchone of count() or
+            # exists() would leave the rest not fetched
+            self._select(selector, tables)
+            with self.timings.phase('scan'):
+                rows = tuple(self._results)
+            with self.timings.phase('cache'):
+                # empty result counts as a row, so misses are evicted too
+                result_cache.set(key, versions, rows, rows=max(1, len(rows)))
+        self._results = iter(rows)
+
+    def _select(self, selector, tables):
+        self.tables = {
+            name: TableCursor(table) for name, table in tables.items()}
         self.fields = []
         for full_name, column in selector.columns:
             if isinstance(full_name, str):
@@ -151,7 +413,6 @@ class Cursor:
                 field = EvaluatedField(self, full_name[1], column)
             self.fields.append(field)
             self.fields_map[field.alias] = field
-        self.condition = expressions.WhereNode(selector.where, self)
         self.joins = {}
         for alias, table in selector.tables.items():
             if isinstance(table, datastructures.BaseTable):
@@ -163,55 +424,434 @@ class Cursor:
                 self.joins[alias] = JoinCondition(table, self)
         if self._base_table is None:
             raise DatabaseError('Base table not found')
-        for table in self.tables.values():
-            if table != self._base_table:
-                table.cached = True
+        where = self._where = expressions.WhereNode(selector.where, self)
+        # rows found by index are only checked by condition
+        probed = where.probe_index()
+        mask = None
+        if self.vectorized and probed is None:
+            try:
+                mask, self.condition = where.vectorize_partially()
+            except vectorized.NotVectorizable as e:
+                logger.debug(f'Query not vectorized: {e}')
+        self._vectorized_filter = mask is not None
+        if mask is None:
+            self.condition = where.compile()
+        self.condition = self.condition or (lambda row_id: True)
+        if selector.having is not None:
+            having = expressions.WhereNode(selector.having, self)
+            self._having = having.compile()
+        self._having = self._having or (lambda row_id: True)
+        self._grouped = bool(selector.group_by or self.aggregations)
+        if self._grouped:
+            self._group_key = self._get_group_key()
+        self._ordering = self._get_ordering()
+        rows = None if probed is not None else self._get_presorted_rows()
+        self._presorted = rows is not None
+        if probed is not None:
+            rows = probed
+        elif rows is None:
+            rows = range(self._base_table.row_count)
+            if mask is not None:
+                rows = vectorized.nonzero(mask)
+        elif mask is not None:
+            rows = vectorized.select(rows, mask)
+        self._candidates = len(rows) if hasattr(rows, '__len__') \
+            else self._base_table.row_count
+        self._rows = iter(rows)
+        self._results = self._get_results()
+
+    def _explain(self, explain_info):
+        """
+        Rows of explain result. With analyze option the query is executed,
+        to add actual numbers of rows and timings.
+        """
+        nodes = {}
+        plan = self._get_plan(nodes)
+        phases = None
+        if explain_info.options.get('analyze'):
+            with self.timings.phase('scan'):
+                returned = sum(1 for _ in self._results)
+            nodes['scan'].actual = self.timings.rows_scanned
+            if 'aggregate' in nodes:
+                nodes['aggregate'].actual = self._group_count
+            plan.actual = returned
+            phases = {
+                name: round(spent * 1000, 3)
+                for name, spent in self.timings.phases.items() if spent}
+        return explain.render(plan, explain_info.format, phases)
+
+    def _get_plan(self, nodes):
+        """
+        Plan of prepared select as tree of explain.PlanNode, its scan and
+        aggregate nodes are added to nodes.
+        """
+        selector = self.selector
+        node = nodes['scan'] = self._get_scan_node()
+        joins = [join.explain() for join in self.joins.values()]
+        if self._grouped:
+            # the same aggregate could be used in SELECT and HAVING
+            aggregates = ', '.join(dict.fromkeys(
+                explain.describe(a.node) for a in self.aggregations))
+            if selector.group_by:
+                keys = ', '.join(
+                    explain.describe(e) for e in selector.group_by)
+                node = explain.PlanNode(
+                    'Hash aggregate', f'group by {keys}: {aggregates}',
+                    None, [node] + joins)
+            else:
+                node = explain.PlanNode(
+                    'Aggregate', aggregates, 1, [node] + joins)
+            nodes['aggregate'] = node
+            if selector.having is not None:
+                node = explain.PlanNode(
+                    'Filter', str(selector.having), None, [node])
+        else:
+            node.children.extend(joins)
+        low_mark, high_mark = selector.low_mark, selector.high_mark
+        rows = node.rows
+        if self._ordering and not self._presorted:
+            keys = ', '.join(
+                f"{field.alias}{' DESC' if descending else ''}"
+                for field, descending, _ in self._ordering)
+            if high_mark is None:
+                node = explain.PlanNode('Sort', keys, rows, [node])
+            else:
+                if rows is not None:
+                    rows = min(rows, high_mark)
+                node = explain.PlanNode(
+                    'Top-N heap sort', f'{keys}, keep {high_mark} rows',
+                    rows, [node])
+        if low_mark or high_mark is not None:
+            if rows is not None:
+                rows = max(rows - low_mark, 0)
+            detail = f'offset {low_mark}'
+            if high_mark is not None:
+                detail += f', limit {high_mark - low_mark}'
+                if rows is not None:
+                    rows = min(rows, high_mark - low_mark)
+            node = explain.PlanNode('Limit', detail, rows, [node])
+        return node
+
+    def _get_scan_node(self):
+        probed = self._where.probed
+        detail = ''
+        if probed is not None:
+            name = 'Index scan'
+            field, kind = probed
+            if field.number == -1:
+                detail = 'by row id'
+            else:
+                detail = f'using {kind} index of {field.name}'
+        elif self._presorted:
+            name = 'Ordered scan'
+            field, descending, _ = self._ordering[0]
+            if field.number == -1:
+                detail = 'in row order'
+            else:
+                detail = f'using sorted index of {field.name}'
+            if descending:
+                detail += ' backward'
+        elif self._vectorized_filter:
+            name = 'Vectorized scan'
+            detail = 'rows of filter mask'
+        else:
+            name = 'Seq scan'
+        if self._where.node.children:
+            where = f'filter {self._where.node}'
+            detail = f'{detail}, {where}' if detail else where
+        return explain.PlanNode(
+            f'{name} {self._base_table.name}', detail, self._candidates)
+
+    def _execute_insert(self, modifier):
+        table_changes = self.connection.get_changes(modifier.table)
+        numbers = {
+            name.lower(): number for number, name in
+            enumerate(table_changes.table.field_names)}
+        columns = []
+        for column in modifier.columns:
+            column = column.lower()
+            if column == 'id':
+                # id is row position, it can't be set
+                columns.append(None)
+            elif column in numbers:
+                columns.append(numbers[column])
+            else:
+                raise DatabaseError(
+                    f'Field {column} not found in table {modifier.table}')
+        rows = [
+            {
+                number: value for number, value in zip(columns, row)
+                if number is not None
+            }
+            for row in modifier.rows]
+        row_ids = table_changes.insert(rows)
+        self.rowcount = len(row_ids)
+        self._results = iter([(row_id,) for row_id in row_ids])
+
+    def _execute_update(self, modifier):
+        table_changes = self.connection.get_changes(modifier.table)
+        rows = self._get_rows(modifier, table_changes.table)
+        values = []
+        for column, value in modifier.values:
+            field = self.get_or_create_field(
+                '.'.join([modifier.table, column]))
+            if field.number == -1:
+                raise DatabaseError('Row id can not be updated')
+            if hasattr(value, 'resolve_expression'):
+                getter = expressions.BaseNode.build_node(value, self).compile()
+            else:
+                getter = (lambda value: lambda row_id: value)(value)
+            values.append((field.number, getter))
+        for row_id in rows:
+            table_changes.update(row_id, {
+                number: getter(row_id) for number, getter in values})
+        self.rowcount = len(rows)
+
+    def _execute_delete(self, modifier):
+        table_changes = self.connection.get_changes(modifier.table)
+        rows = self._get_rows(modifier, table_changes.table)
+        table_changes.delete(rows)
+        self.rowcount = len(rows)
+
+    def _get_rows(self, modifier, table):
+        """Row ids of the table matching WHERE of UPDATE or DELETE."""
+        self._base_table = TableCursor(table)
+        self.tables = {table.name: self._base_table}
+        self.joins = {}
+        where = expressions.WhereNode(modifier.where, self)
+        rows = where.probe_index()
+        if rows is None:
+            rows = range(table.row_count)
+        condition = where.compile()
+        return [row_id for row_id in rows if condition(row_id)]
 
-    def __next__(self):
+    @property
+    def vectorized(self):
+        return self.connection.vectorized
+
+    @property
+    def base_table(self):
+        return self._base_table
+
+    def _scan(self):
+        condition = self.condition
+        table = self._base_table
+        getters = [field.compile() for field in self.fields]
+        timings = self.timings
+        # here should be kind of strategy for joins, how to iterate
+        # multiple tables, but it is not implemented yet
+        for row_id in self._rows:
+            timings.rows_scanned += 1
+            table.seek(row_id)
+            if condition(row_id):
+                yield tuple([getter(row_id) for getter in getters])
+        table.seek(None)
+
+    def _scan_groups(self):
+        """
+        Hash aggregation. Rows are grouped by GROUP BY key in one scan,
+        collecting row ids to aggregate for each group, then every aggregate
+        is reduced for all groups at once.
+        """
+        condition = self.condition
+        group_key = self._group_key
+        table = self._base_table
+        # the same aggregate could be used in SELECT and HAVING
+        aggregations = {}
+        for aggregation in self.aggregations:
+            aggregations.setdefault(aggregation.node, []).append(aggregation)
+        getters = [same[0].compile_rows() for same in aggregations.values()]
+        groups = {}
+        timings = self.timings
+        for row_id in self._rows:
+            timings.rows_scanned += 1
+            table.seek(row_id)
+            if not condition(row_id):
+                continue
+            key = group_key(row_id)
+            group = groups.get(key)
+            if group is None:
+                group = groups[key] = (row_id, [[] for _ in getters])
+            for rows, get_rows in zip(group[1], getters):
+                rows.extend(get_rows(row_id))
+        if not groups and not self.selector.group_by:
+            # aggregation without GROUP BY returns a row even for no rows
+            groups[()] = (None, [[] for _ in getters])
+        groups = list(groups.values())
+        self._group_count = len(groups)
+        with timings.phase('aggregate'):
+            for number, same in enumerate(aggregations.values()):
+                results = same[0].reduce_groups(
+                    [rows[number] for _, rows in groups])
+                for aggregation in same:
+                    aggregation.results = results
+        having = self._having
+        for number, (row_id, _) in enumerate(groups):
+            self.group = number
+            table.seek(row_id)
+            if having(row_id):
+                yield tuple(f.value for f in self.fields)
+        table.seek(None)
+
+    def _get_group_key(self):
+        """Return function of base table row id, returning GROUP BY key."""
+        getters = []
+        for expression in self.selector.group_by:
+            node = expressions.BaseNode.build_node(expression, self)
+            if isinstance(node, expressions.ColumnNode):
+                if node.field.table is not self._base_table:
+                    raise DatabaseError(
+                        f'Grouping by {node.field} of joined table')
+                if node.field.number == -1:
+                    # primary key determines all other columns
+                    return lambda row_id: row_id
+            getters.append(node.compile())
+        return lambda row_id: tuple(getter(row_id) for getter in getters)
+
+    def _get_results(self):
+        """
+        Apply ordering and limits to the scan. Without ordering scan stops
+        as soon as limit is reached, with ordering only top rows are kept.
+        """
+        rows = self._scan_groups() if self._grouped else self._scan()
+        low_mark, high_mark = self.selector.low_mark, self.selector.high_mark
+        if not self._ordering or self._presorted:
+            yield from itertools.islice(rows, low_mark, high_mark)
+            return
+        key, reverse = self._get_sort_key()
+        timings = self.timings
+        if high_mark is None:
+            # rows are scanned before sorting, to measure time of both
+            rows = list(rows)
+            with timings.phase('sort'):
+                rows.sort(key=key, reverse=reverse)
+            yield from itertools.islice(rows, low_mark, None)
+            return
+        select = heapq.nlargest if reverse else heapq.nsmallest
+        size = max(1024, high_mark)
+        result = []
         while True:
-            # here should be kind of strategy for joins, how to iterate
-            # multiple tables, but it is not implemented yet
-            next(self._base_table)
-            if self.condition.evaluate():
+            chunk = list(itertools.islice(rows, size))
+            if not chunk:
                 break
-        return tuple(f.value for f in self.fields)
+            with timings.phase('sort'):
+                result = select(high_mark, result + chunk, key=key)
+        yield from itertools.islice(result, low_mark, high_mark)
+
+    def __next__(self):
+        row = self.fetchone()
+        if row is None:
+            raise StopIteration
+        return row
 
     def __iter__(self):
         return self
 
     def fetchone(self):
-        if self.selector.order_by:
-            result = self.fetchall()
-            return result[0] if result else None
-        try:
-            return next(self)
-        except StopIteration:
-            return None
+        with self.timings.phase('scan'):
+            row = next(self._results, None)
+        if row is None:
+            self._report()
+        else:
+            self.timings.rows_returned += 1
+        return row
 
     def fetchmany(self, itersize):
-        if self.selector.order_by:
-            return self.fetchall()
-        return list(itertools.islice(self, itersize))
+        with self.timings.phase('scan'):
+            rows = list(itertools.islice(self._results, itersize))
+        self.timings.rows_returned += len(rows)
+        if len(rows) < itersize:
+            self._report()
+        return rows
 
     def fetchall(self):
-        return self._apply_order(list(self))
-
-    def _apply_order(self, result):
-        # apply ordering in reverse - so first items will have more effect,
-        # as they applied last
-        for ordering, _ in reversed(self.selector.order_by):
-            compiler = self.selector.compiler
-            field_alias = ordering.expression.as_sql(
+        with self.timings.phase('scan'):
+            rows = list(self._results)
+        self.timings.rows_returned += len(rows)
+        self._report()
+        return rows
+
+    def _get_ordering(self):
+        """Return list of (selected field, descending, nulls first)."""
+        ordering = []
+        compiler = self.selector.compiler
+        for order_by, _ in self.selector.order_by or []:
+            field_alias = order_by.expression.as_sql(
                 compiler, compiler.connection)[0].lower()
             field = self.fields_map.get(field_alias)
-            try:
-                field_num = self.fields.index(field)
-            except ValueError:
+            if field not in self.fields:
                 raise DatabaseError(
                     f'Ordering field {field_alias} not found in query')
-            result.sort(
-                # tricky way to avoid comparing None and int
-                # https://scipython.com/book2/chapter-4-the-core-python-language-ii/questions/sorting-a-list-containing-none/
-                key=lambda x: (x[field_num] is not None, x[field_num]),
-                reverse=ordering.descending)
-        return result
+            if order_by.nulls_first or order_by.nulls_last:
+                nulls_first = bool(order_by.nulls_first)
+            else:
+                # NULL is less than any value by default
+                nulls_first = not order_by.descending
+            ordering.append((field, order_by.descending, nulls_first))
+        return ordering
+
+    def _get_presorted_rows(self):
+        """
+        Base table rows in order of the query, if it is ordered by one
+        column of the base table, so rows are read already sorted.
+        """
+        if len(self._ordering) != 1 or self._grouped:
+            return None
+        field, descending, nulls_first = self._ordering[0]
+        if not isinstance(field, CursorField) or \
+                field.table is not self._base_table:
+            return None
+        if field.number == -1:
+            rows = range(self._base_table.row_count)
+            return reversed(rows) if descending else rows
+        index = self._base_table.get_sorted_rows(
+            field.number, descending, field.kind)
+        if index is None:
+            return None
+        nulls, values = index
+        if nulls_first:
+            return itertools.chain(nulls, values)
+        return itertools.chain(values, nulls)
+
+    def _get_sort_key(self):
+        """
+        Composite key of all ordering fields, to sort result in one pass.
+        Return key function and reverse flag.
+        """
+        directions = set(descending for _, descending, _ in self._ordering)
+        # with the same direction for all fields, sort is just reversed
+        reverse = directions == {True}
+        parts = []
+        for field, descending, nulls_first in self._ordering:
+            null_low = nulls_first != reverse
+            parts.append((
+                self.fields.index(field),
+                descending and not reverse,
+                (0, None) if null_low else (1, None),
+                1 if null_low else 0,
+            ))
+
+        def key(row):
+            result = []
+            for field_num, wrap, null_key, rank in parts:
+                value = row[field_num]
+                if value is None:
+                    result.append(null_key)
+                else:
+                    result.append((rank, Descending(value) if wrap else value))
+            return result
+        return key, reverse
+
+
+class Descending:
+    """Value wrapper, reversing comparison."""
+    __slots__ = ('value',)
+
+    def __init__(self, value):
+        self.value = value
+
+    def __lt__(self, other):
+        return other.value < self.value
+
+    def __eq__(self, other):
+        return self.value == other.value
@@ -0,0 +1,95 @@
+"""
+Execution plan of select queries, returned by QuerySet.explain().
+
+Plan is a tree of nodes, from limit and sort on top to scan of the base
+table and hash joins at the bottom. Every node has estimated number of its
+output rows, known before the scan: rows found by index, rows of tables.
+With analyze=True option the query is executed and actual numbers of rows
+and phase timings are added.
+"""
+import json
+
+from django.db.models import expressions
+
+
+class PlanNode:
+    name = None
+    detail = None
+    # estimated and actual number of output rows, None if unknown
+    rows = None
+    actual = None
+
+    def __init__(self, name, detail='', rows=None, children=()):
+        self.name = name
+        self.detail = detail
+        self.rows = rows
+        self.children = list(children)
+
+    def as_dict(self):
+        result = {'node': self.name}
+        if self.detail:
+            result['detail'] = self.detail
+        if self.rows is not None:
+            result['rows'] = self.rows
+        if self.actual is not None:
+            result['actual_rows'] = self.actual
+        if self.children:
+            result['children'] = [child.as_dict() for child in self.children]
+        return result
+
+    def lines(self, level=0):
+        counts = []
+        if self.rows is not None:
+            counts.append(f'rows={self.rows}')
+        if self.actual is not None:
+            counts.append(f'actual rows={self.actual}')
+        line = self.name
+        if self.detail:
+            line += f': {self.detail}'
+        if counts:
+            line += f"  ({' '.join(counts)})"
+        if level:
+            line = '  ' * (level - 1) + '-> ' + line
+        yield line
+        for child in self.children:
+            yield from child.lines(level + 1)
+
+
+def describe(expression):
+    """Short description of django expression."""
+    target = getattr(expression, 'target', None)
+    alias = getattr(expression, 'alias', None)
+    if target is not None and alias is not None:
+        return f'{alias}.{target.column}'
+    if isinstance(expression, expressions.CombinedExpression):
+        return (f'{describe(expression.lhs)} {expression.connector} '
+                f'{describe(expression.rhs)}')
+    if isinstance(expression, expressions.Value):
+        return repr(expression.value)
+    if hasattr(expression, 'get_source_expressions') and \
+            hasattr(expression, 'function'):
+        sources = ', '.join(
+            describe(source)
+            for source in expression.get_source_expressions())
+        distinct = 'DISTINCT ' if getattr(expression, 'distinct', False) \
+            else ''
+        return f'{expression.function}({distinct}{sources})'
+    return str(expression)
+
+
+def render(plan, format=None, phases=None):
+    """
+    Rows of explain result: plan lines for text format, one row of JSON
+    string for JSON. Phases are timings of analyzed query in milliseconds.
+    """
+    if (format or '').upper() == 'JSON':
+        result = {'plan': plan.as_dict()}
+        if phases is not None:
+            result['timings_ms'] = phases
+        # string row is returned by django as is, for any format spelling
+        return [json.dumps(result, ensure_ascii=False)]
+    rows = [(line,) for line in plan.lines()]
+    if phases is not None:
+        rows.append((' '.join(
+            f'{name}={spent}ms' for name, spent in phases.items()),))
+    return rows
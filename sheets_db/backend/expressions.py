@@ -1,4 +1,9 @@
+import datetime
+import decimal
+import operator
+
 from django import db
+from django.db.models.sql import constants
 from django.db.models.sql import where
 from django.db.models import lookups
 from django.db.models import expressions
@@ -6,8 +11,19 @@ from django.db.models import aggregates
 from django.db.models.fields import related_lookups
 from django.db.models.functions import datetime as dj_datetime
 
+from sheets_db.backend import vectorized
+
+# plain values, passed by django as lookup parameters
+VALUE_TYPES = (
+    str, int, float, bool, list, tuple, datetime.date, decimal.Decimal)
+
 
 class BaseNode:
+    # node value doesn't depend on row
+    is_constant = False
+    # (field, index kind) of index used by probe_index, for explain
+    probed = None
+
     def __init__(self, node, cursor):
         self.node = node
         self.cursor = cursor
@@ -15,12 +31,34 @@ class BaseNode:
     def evaluate(self):
         raise NotImplementedError()
 
+    def compile(self):
+        """
+        Return function of base table row id, evaluating the node. Anything
+        that could be resolved without row is resolved here once per query.
+        """
+        return lambda row_id: self.evaluate()
+
+    def probe_index(self):
+        """
+        Row ids of base table, that could match the condition, found by
+        index. None if index can't be used.
+        """
+        return None
+
+    def vectorize(self):
+        """
+        Evaluate node for all rows of base table at once. Return vector of
+        values, rows mask for conditions, or plain value for constants.
+        """
+        raise vectorized.NotVectorizable(
+            f'Expression {self.node.__class__} not vectorizable')
+
     def get_child(self, node):
         return self.build_node(node, self.cursor)
 
     @classmethod
     def build_node(cls, node, cursor):
-        if isinstance(node, (str, int, bool, list, tuple)):
+        if isinstance(node, VALUE_TYPES):
             node_cls = SimpleValueNode
         else:
             node_cls = expressions_map.get(node.__class__)
@@ -49,27 +87,102 @@ class WhereNode(BaseNode):
             result = not result
         return result
 
+    def compile(self):
+        return self.compile_children(self.children)
+
+    def compile_children(self, children):
+        children = [child.compile() for child in children]
+        negated = self.node.negated
+        if self.node.connector == where.AND:
+            if not children:
+                return lambda row_id: not negated
+            if len(children) == 1:
+                child = children[0]
+                if negated:
+                    return lambda row_id: not child(row_id)
+                return lambda row_id: bool(child(row_id))
+
+            def condition(row_id):
+                for child in children:
+                    if not child(row_id):
+                        return negated
+                return not negated
+        else:
+            def condition(row_id):
+                for child in children:
+                    if child(row_id):
+                        return not negated
+                return negated
+        return condition
+
+    def vectorize(self):
+        masks = [child.vectorize() for child in self.children]
+        if any(isinstance(mask, vectorized.Vector) for mask in masks):
+            raise vectorized.NotVectorizable('Value used as condition')
+        return vectorized.reduce_masks(
+            self.node.connector == where.AND, masks, self.node.negated,
+            self.cursor.base_table.row_count)
+
+    def probe_index(self):
+        """Rows of the most selective index of AND conditions."""
+        if self.node.connector != where.AND or self.node.negated:
+            return None
+        result = None
+        for child in self.children:
+            rows = child.probe_index()
+            if rows is None:
+                continue
+            if result is None or len(rows) < len(result):
+                result = rows
+                self.probed = child.probed
+        return result
+
+    def vectorize_partially(self):
+        """
+        Vectorize conditions of AND, that could be vectorized. Return mask
+        of rows and compiled condition of the rest, to check rows of mask.
+        """
+        if self.node.connector != where.AND or self.node.negated:
+            return self.vectorize(), None
+        masks = []
+        rest = []
+        for child in self.children:
+            try:
+                mask = child.vectorize()
+            except vectorized.NotVectorizable:
+                rest.append(child)
+                continue
+            if isinstance(mask, vectorized.Vector):
+                rest.append(child)
+            else:
+                masks.append(mask)
+        if not masks:
+            raise vectorized.NotVectorizable('No conditions vectorized')
+        mask = vectorized.reduce_masks(
+            True, masks, False, self.cursor.base_table.row_count)
+        return mask, self.compile_children(rest) if rest else None
+
 
 simple_operations = {
-    'exact': lambda x, y: x == y,
-    'lt': lambda x, y: x < y,
-    'lte': lambda x, y: x <= y,
-    'gt': lambda x, y: x > y,
-    'gte': lambda x, y: x >= y,
-    '+': lambda x, y: x + y,
-    '-': lambda x, y: x - y,
-    '*': lambda x, y: x * y,
-    '/': lambda x, y: x / y,
-    '^': lambda x, y: x ** y,
-    '%': lambda x, y: x % y,
-    '&': lambda x, y: x & y,
-    '|': lambda x, y: x | y,
-    '<<': lambda x, y: x << y,
-    '>>': lambda x, y: x >> y,
-    '#': lambda x, y: x ^ y,
+    'exact': operator.eq,
+    'lt': operator.lt,
+    'lte': operator.le,
+    'gt': operator.gt,
+    'gte': operator.ge,
+    '+': operator.add,
+    '-': operator.sub,
+    '*': operator.mul,
+    '/': operator.truediv,
+    '^': operator.pow,
+    '%': operator.mod,
+    '&': operator.and_,
+    '|': operator.or_,
+    '<<': operator.lshift,
+    '>>': operator.rshift,
+    '#': operator.xor,
     'iexact': lambda x, y: x.lower() == y.lower(),
     'in': lambda x, y: x in y,
-    'contains': lambda x, y: y in x,
+    'contains': operator.contains,
     'icontains': lambda x, y: y.lower() in x.lower(),
     'startswith': lambda x, y: x.startswith(y),
     'istartswith': lambda x, y: x.lower().startswith(y.lower()),
@@ -80,6 +193,33 @@ simple_operations = {
 }
 
 
+# placeholder of lookup value in bounds
+RHS = object()
+# (low, high, include low, include high) of lookups by sorted index
+range_bounds = {
+    'lt': (None, RHS, True, False),
+    'lte': (None, RHS, True, True),
+    'gt': (RHS, None, False, True),
+    'gte': (RHS, None, True, True),
+}
+
+
+def get_year_bounds(lookup_name, year, kind):
+    """Bounds of date column values for lookup of year."""
+    if kind not in ('date', 'datetime') or not isinstance(year, int) or \
+            not datetime.MINYEAR <= year < datetime.MAXYEAR:
+        return None
+    date_cls = datetime.datetime if kind == 'datetime' else datetime.date
+    start, end = date_cls(year, 1, 1), date_cls(year + 1, 1, 1)
+    return {
+        'exact': (start, end, True, False),
+        'gt': (end, None, True, True),
+        'gte': (start, None, True, True),
+        'lt': (None, start, True, False),
+        'lte': (None, end, True, False),
+    }.get(lookup_name)
+
+
 class SimpleOperationNode(BaseNode):
     operation = None
 
@@ -92,41 +232,180 @@ class SimpleOperationNode(BaseNode):
         return self.operation or simple_operations.get(
             self.node.lookup_name)
 
+    @property
+    def null_safe(self):
+        """Operation is applied to NULL operands too."""
+        return getattr(self.node, 'lookup_name', None) == 'isnull'
+
     def evaluate(self):
         operation = self.get_operation()
         if not operation:
             raise NotImplementedError(f'Operation {self.node} not implemented')
         lhs, rhs = self.lhs.evaluate(), self.rhs.evaluate()
-        if lhs is None or rhs is None:
+        if (lhs is None or rhs is None) and not self.null_safe:
             return None
         return operation(lhs, rhs)
 
+    def get_constant_set(self):
+        """Values of IN as set, None if they are not hashable."""
+        try:
+            return frozenset(self.rhs.evaluate())
+        except TypeError:
+            return None
+
+    def probe_index(self):
+        """
+        Rows of indexed base table column: exact and IN lookups are
+        answered by hash index, range and year lookups by sorted one.
+        """
+        lookup_name = getattr(self.node, 'lookup_name', None)
+        lhs = self.lhs
+        year = isinstance(lhs, BaseExtractDate) and lhs.param == 'year'
+        if year:
+            lhs = lhs.column
+        if not self.rhs.is_constant or not isinstance(lhs, ColumnNode):
+            return None
+        field = lhs.field
+        if field.table is not self.cursor.base_table or not field.is_indexed:
+            return None
+        value = self.rhs.evaluate()
+        if value is None:
+            return None
+        if year:
+            bounds = get_year_bounds(lookup_name, value, field.kind)
+        elif lookup_name == 'range':
+            bounds = (value[0], value[1], True, True)
+        else:
+            bounds = range_bounds.get(lookup_name)
+            if bounds is not None:
+                bounds = tuple(value if b is RHS else b for b in bounds)
+        if bounds is not None:
+            rows = field.probe_range(*bounds)
+            if rows is not None:
+                self.probed = (field, 'sorted')
+            return rows
+        if lookup_name == 'exact':
+            values = (value,)
+        elif lookup_name == 'in':
+            values = self.get_constant_set()
+        else:
+            return None
+        try:
+            rows = field.probe(values)
+        except TypeError:
+            # not hashable values
+            return None
+        self.probed = (field, 'hash')
+        return rows
+
+    def compile(self):
+        operation = self.get_operation()
+        if not operation:
+            raise NotImplementedError(f'Operation {self.node} not implemented')
+        lhs = self.lhs.compile()
+        if not self.rhs.is_constant:
+            rhs = self.rhs.compile()
+
+            def evaluate(row_id):
+                lhs_value, rhs_value = lhs(row_id), rhs(row_id)
+                if lhs_value is None or rhs_value is None:
+                    return None
+                return operation(lhs_value, rhs_value)
+            return evaluate
+        rhs_value = self.rhs.evaluate()
+        if getattr(self.node, 'lookup_name', None) == 'in':
+            # hashed once per query, not searched in list for every row
+            rhs_value = self.get_constant_set() or rhs_value
+        if self.null_safe:
+            return lambda row_id: operation(lhs(row_id), rhs_value)
+        if rhs_value is None:
+            return lambda row_id: None
+
+        def evaluate_constant(row_id):
+            lhs_value = lhs(row_id)
+            if lhs_value is None:
+                return None
+            return operation(lhs_value, rhs_value)
+        return evaluate_constant
+
+    def vectorize(self):
+        lhs, rhs = self.lhs.vectorize(), self.rhs.vectorize()
+        if not isinstance(lhs, vectorized.Vector):
+            raise vectorized.NotVectorizable('Lookup of constant')
+        if rhs is None:
+            return lhs.nulls & False
+        return vectorized.lookup(self.node.lookup_name, lhs, rhs)
+
 
 class ColumnNode(BaseNode):
     def __init__(self, node, cursor):
         super(ColumnNode, self).__init__(node, cursor)
         alias, column = node.alias, node.target.column
         identifiers = (alias, column) if alias else (column,)
-        self.field = cursor.get_or_create_field('.'.join(identifiers))
+        self.field = cursor.get_or_create_field('.'.join(identifiers), node)
 
     def evaluate(self):
         return self.field.value
 
+    def compile(self):
+        return self.field.compile()
+
+    def vectorize(self):
+        return self.field.vectorize()
+
 
 class ValueNode(BaseNode):
+    is_constant = True
+
     def evaluate(self):
         return self.node.value
 
+    def compile(self):
+        value = self.evaluate()
+        return lambda row_id: value
 
-class SimpleValueNode(BaseNode):
+    def vectorize(self):
+        return self.evaluate()
+
+
+class SimpleValueNode(ValueNode):
     def evaluate(self):
         return self.node
 
 
+class RawSQLNode(ValueNode):
+    """
+    Raw SQL of number constant only, like extra select added by exists().
+    """
+    value = None
+
+    def __init__(self, node, cursor):
+        super(RawSQLNode, self).__init__(node, cursor)
+        try:
+            self.value = int(node.sql)
+        except ValueError:
+            self.value = None
+        if self.value is None or node.params:
+            raise NotImplementedError(f'Raw SQL {node.sql!r} not implemented')
+
+    def evaluate(self):
+        return self.value
+
+
 class CombinedExpression(SimpleOperationNode):
     def get_operation(self):
         return simple_operations.get(self.node.connector)
 
+    @property
+    def null_safe(self):
+        return False
+
+    def vectorize(self):
+        lhs, rhs = self.lhs.vectorize(), self.rhs.vectorize()
+        if not isinstance(lhs, vectorized.Vector):
+            raise vectorized.NotVectorizable('Operation on constant')
+        return vectorized.combine(self.node.connector, lhs, rhs)
+
 
 class BaseExtractDate(BaseNode):
     param = None
@@ -141,6 +420,17 @@ class BaseExtractDate(BaseNode):
             return None
         return getattr(value, self.param)
 
+    def compile(self):
+        column = self.column.compile()
+        param = self.param
+
+        def extract(row_id):
+            value = column(row_id)
+            if value is None:
+                return None
+            return getattr(value, param)
+        return extract
+
     @classmethod
     def extract(cls, extract_param):
         class ParamExtractor(cls):
@@ -149,75 +439,104 @@ class BaseExtractDate(BaseNode):
 
 
 class CountAggregation(BaseNode):
+    """
+    Aggregate function. Rows are grouped by cursor, aggregation only
+    collects row ids of aggregated table for a row and reduces values of
+    all groups.
+    """
+    reduction = 'count'
+    field = None
+    # results of all groups, in order of cursor groups
+    results = None
+
     def __init__(self, node, cursor):
         super(CountAggregation, self).__init__(node, cursor)
         if len(node.source_expressions) != 1:
             raise db.DatabaseError('Only one expression aggregates supported')
         exp = node.source_expressions[0]
-        self.column = self.get_child(exp)
-        self.field = self.column.field
+        if not isinstance(exp, expressions.Star):
+            self.column = self.get_child(exp)
+            self.field = self.column.field
+        cursor.aggregations.append(self)
+
+    def compile_rows(self):
+        """
+        Return function of base table row id, returning row ids of the
+        aggregated table for it. Base table row is repeated for every row
+        of joined table, as SQL aggregates joined rows.
+        """
+        if self.field is not None and \
+                self.field.table is not self.cursor.base_table:
+            return self.cursor.joins[self.field.table.name].compile_probe()
+        joins = list(self.cursor.joins.values())
+        if not joins:
+            return lambda row_id: (row_id,)
+        if len(joins) > 1:
+            raise db.NotSupportedError(
+                f'{self.node.name} of base table with several joins')
+        probe = joins[0].compile_probe()
+        if joins[0].node.join_type == constants.LOUTER:
+            # row without joined ones is joined to NULLs once
+            return lambda row_id: (row_id,) * max(len(probe(row_id)), 1)
+        return lambda row_id: (row_id,) * len(probe(row_id))
+
+    def reduce_groups(self, groups):
+        """Aggregate values of each group of aggregated table row ids."""
+        if self.field is None:
+            return [len(rows) for rows in groups]
+        if self.cursor.vectorized and not self.node.distinct:
+            try:
+                column = self.field.vectorize(self.field.table)
+                return vectorized.group_reduce(column, groups, self.reduction)
+            except vectorized.NotVectorizable:
+                pass
+        values = self.field.get_values()
+        results = []
+        for rows in groups:
+            group = [values[i] for i in rows if values[i] is not None]
+            if self.node.distinct:
+                group = set(group)
+            results.append(self.reduce(group))
+        return results
+
+    def reduce(self, values):
+        """Aggregate not NULL values of a group."""
+        return len(values)
 
     def evaluate(self):
-        counter = 0
-        values = set()
-        for _ in self.cursor.joins[self.field.table.name]:
-            value = self.field.value
-            if self.node.distinct:
-                values.add(value)
-            elif value is not None:
-                counter += 1
-        return len(values) if self.node.distinct else counter
+        return self.results[self.cursor.group]
 
 
 class AvgAggregation(CountAggregation):
-    def evaluate(self):
-        counter = 0
-        total_sum = 0
-        for _ in self.cursor.joins[self.field.table.name]:
-            value = self.field.value
-            if value is not None:
-                counter += 1
-                total_sum += value
-        return total_sum / counter if counter else None
+    reduction = 'avg'
+
+    def reduce(self, values):
+        return sum(values) / len(values) if values else None
 
 
 class SumAggregation(CountAggregation):
-    def evaluate(self):
-        total_sum = None
-        for _ in self.cursor.joins[self.field.table.name]:
-            value = self.field.value
-            if value is not None:
-                total_sum = (total_sum or 0) + value
-        return total_sum
+    reduction = 'sum'
+
+    def reduce(self, values):
+        return sum(values) if values else None
 
 
 class MaxAggregation(CountAggregation):
-    def evaluate(self):
-        result = None
-        for _ in self.cursor.joins[self.field.table.name]:
-            value = self.field.value
-            if value is not None:
-                if result is None:
-                    result = value
-                else:
-                    result = max(result, value)
-        return result
+    reduction = 'max'
+
+    def reduce(self, values):
+        return max(values, default=None)
 
 
 class MinAggregation(CountAggregation):
-    def evaluate(self):
-        result = None
-        for _ in self.cursor.joins[self.field.table.name]:
-            value = self.field.value
-            if value is not None:
-                if result is None:
-                    result = value
-                else:
-                    result = min(result, value)
-        return result
+    reduction = 'min'
+
+    def reduce(self, values):
+        return min(values, default=None)
 
 
 expressions_map = {
+    where.WhereNode: WhereNode,
     lookups.Exact: SimpleOperationNode,
     lookups.IExact: SimpleOperationNode,
     lookups.GreaterThan: SimpleOperationNode,
@@ -239,6 +558,7 @@ expressions_map = {
     lookups.IRegex: None,
     expressions.Col: ColumnNode,
     expressions.Value: ValueNode,
+    expressions.RawSQL: RawSQLNode,
     expressions.CombinedExpression: CombinedExpression,
     lookups.YearExact: SimpleOperationNode,
     lookups.YearGt: SimpleOperationNode,
@@ -264,4 +584,5 @@ expressions_map = {
     aggregates.StdDev: None,
     aggregates.Variance: None,
     related_lookups.RelatedIn: SimpleOperationNode,
+    related_lookups.RelatedExact: SimpleOperationNode,
 }
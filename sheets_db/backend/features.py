@@ -4,3 +4,10 @@ from django.db.backends.base.features import BaseDatabaseFeatures
 class DummyDatabaseFeatures(BaseDatabaseFeatures):
     supports_transactions = False
     uses_savepoints = False
+    has_bulk_insert = True
+    # ids of inserted rows are their positions in sheet
+    can_return_columns_from_insert = True
+    can_return_rows_from_bulk_insert = True
+    # QuerySet.explain() returns plan of cursor
+    supports_explaining_query_execution = True
+    supported_explain_formats = {'JSON', 'TEXT'}
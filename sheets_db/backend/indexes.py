@@ -0,0 +1,47 @@
+"""
+Declarative secondary indexes of sheet tables.
+
+Sheets have no schema, so indexes are declared by models: unique fields,
+fields with db_index, leading fields of Meta.indexes and columns referenced
+by foreign keys are indexed. Indexes are built lazily by table on the first
+query using them and cached with table data, so every table version is
+indexed only once: hash index for exact and IN lookups, sorted index for
+range lookups.
+"""
+import functools
+
+from django.apps import apps
+
+
+@functools.lru_cache(maxsize=None)
+def get_indexed_fields(model):
+    """Names of indexed fields of the model."""
+    opts = model._meta
+    names = set()
+    for field in opts.get_fields(include_hidden=True):
+        if field.concrete and (field.unique or field.db_index):
+            names.add(field.name)
+        elif field.is_relation and field.auto_created and \
+                not field.concrete and field.remote_field.to_fields:
+            # reverse relation: target of foreign key
+            names.update(
+                name for name in field.remote_field.to_fields if name)
+    for index in opts.indexes:
+        if index.fields:
+            names.add(index.fields[0].lstrip('-'))
+    return frozenset(names)
+
+
+def is_indexed(field):
+    """Model field is indexed."""
+    model = getattr(field, 'model', None)
+    if model is None:
+        return False
+    return field.primary_key or field.name in get_indexed_fields(model)
+
+
+def get_table_models(table_name):
+    table_name = table_name.lower()
+    return [
+        model for model in apps.get_models()
+        if model._meta.db_table.lower() == table_name]
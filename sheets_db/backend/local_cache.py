@@ -0,0 +1,102 @@
+"""
+Process wide LRU cache of decoded tables.
+
+Entries are tagged with version of cached data, so they are used only while
+the version stamp in shared cache stays the same.
+"""
+import collections
+import threading
+import time
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+class Entry:
+    version = None
+    value = None
+    size = 0
+    rows = 0
+    expires = None
+
+    def __init__(self, version, value, size, rows, expires):
+        self.version = version
+        self.value = value
+        self.size = size
+        self.rows = rows
+        self.expires = expires
+
+
+class LocalCache:
+    max_size = None
+    max_rows = None
+    ttl = None
+    size = 0
+    rows = 0
+    # number of get calls, that found valid entry and that did not
+    hits = 0
+    misses = 0
+
+    def __init__(self, max_size, max_rows, ttl):
+        self.max_size = max_size
+        self.max_rows = max_rows
+        self.ttl = ttl
+        self.entries = collections.OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key, version):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            if entry.version != version or entry.expires < time.monotonic():
+                self._remove(key)
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry.value
+
+    def set(self, key, version, value, size=0, rows=0):
+        if size > self.max_size or rows > self.max_rows:
+            return
+        with self.lock:
+            if key in self.entries:
+                self._remove(key)
+            self.entries[key] = Entry(
+                version, value, size, rows, time.monotonic() + self.ttl)
+            self.size += size
+            self.rows += rows
+            while self.size > self.max_size or self.rows > self.max_rows:
+                self._remove(next(iter(self.entries)))
+
+    def stats(self):
+        with self.lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'entries': len(self.entries),
+                'size': self.size,
+                'rows': self.rows,
+            }
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
+            self.rows = 0
+
+    def _remove(self, key):
+        entry = self.entries.pop(key)
+        self.size -= entry.size
+        self.rows -= entry.rows
+
+
+def get_cache(name, max_size, max_rows, ttl):
+    """Get local cache shared by all connections to the same database."""
+    with _caches_lock:
+        local_cache = _caches.get(name)
+        if local_cache is None:
+            local_cache = _caches[name] = LocalCache(max_size, max_rows, ttl)
+        return local_cache
@@ -0,0 +1,114 @@
+"""
+Timings of query phases and metrics hooks.
+
+Every query measures time of its phases: cache lookup, fetch from google,
+decode, planning, scan, join, aggregate and sort, with number of scanned
+and returned rows. Timings are added to connection.queries in debug mode,
+logged for slow queries, longer than SLOW_QUERY_TIME option, and reported
+to metrics backend, set by METRICS option as dotted path of Metrics
+subclass.
+"""
+import functools
+import time
+
+from django.utils.module_loading import import_string
+
+PHASES = (
+    'cache', 'fetch', 'decode', 'plan', 'scan', 'join', 'aggregate', 'sort',
+    'write')
+
+
+class Metrics:
+    """
+    Metrics backend, statsd or prometheus style. Base class ignores all
+    metrics.
+    """
+
+    def counter(self, name, value=1, tags=None):
+        pass
+
+    def histogram(self, name, value, tags=None):
+        pass
+
+
+@functools.lru_cache(maxsize=None)
+def get_backend(path):
+    """Process wide instance of metrics backend class."""
+    if not path:
+        return Metrics()
+    return import_string(path)()
+
+
+class Timings:
+    """
+    Time of query phases. Time of a phase excludes time of phases nested
+    in it, so scan doesn't include sort, done during fetch of results.
+    """
+    rows_scanned = 0
+    rows_returned = 0
+
+    def __init__(self):
+        self.phases = dict.fromkeys(PHASES, 0.0)
+        self._stack = []
+
+    def start(self, name):
+        self._stack.append([name, time.perf_counter(), 0.0])
+
+    def stop(self):
+        name, start, nested = self._stack.pop()
+        spent = time.perf_counter() - start
+        self.phases[name] += spent - nested
+        if self._stack:
+            self._stack[-1][2] += spent
+
+    def phase(self, name):
+        return Phase(self, name)
+
+    @property
+    def total(self):
+        return sum(self.phases.values())
+
+    def as_dict(self):
+        result = {
+            name: round(spent, 6)
+            for name, spent in self.phases.items() if spent}
+        result['rows_scanned'] = self.rows_scanned
+        result['rows_returned'] = self.rows_returned
+        return result
+
+    def __str__(self):
+        phases = ' '.join(
+            f'{name}={spent * 1000:.1f}ms'
+            for name, spent in self.phases.items() if spent)
+        return (f'{phases} scanned={self.rows_scanned} '
+                f'returned={self.rows_returned}')
+
+
+class Phase:
+    """Context manager of a phase, doing nothing without timings."""
+    __slots__ = ('timings', 'name')
+
+    def __init__(self, timings, name):
+        self.timings = timings
+        self.name = name
+
+    def __enter__(self):
+        if self.timings is not None:
+            self.timings.start(self.name)
+
+    def __exit__(self, *args):
+        if self.timings is not None:
+            self.timings.stop()
+        return False
+
+
+def report(backend, timings, tags):
+    backend.counter('sheets_db.queries', 1, tags)
+    backend.histogram('sheets_db.query.time', timings.total, tags)
+    for name, spent in timings.phases.items():
+        if spent:
+            backend.histogram(f'sheets_db.query.{name}', spent, tags)
+    backend.counter(
+        'sheets_db.query.rows_scanned', timings.rows_scanned, tags)
+    backend.counter(
+        'sheets_db.query.rows_returned', timings.rows_returned, tags)
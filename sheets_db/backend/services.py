@@ -0,0 +1,68 @@
+"""
+Pool of google API services.
+
+Building a service and its resources takes hundreds of milliseconds, and
+its http client keeps connections to google alive, so services are built
+once and reused. Http client is not thread safe, so every thread has own
+services.
+"""
+import threading
+
+from google_auth_httplib2 import AuthorizedHttp
+from googleapiclient.discovery import build
+from googleapiclient.http import build_http
+
+_local = threading.local()
+
+
+class Service:
+    """Google API service with authorized keep-alive http and resources."""
+    credentials = None
+    http = None
+    service = None
+    resources = None
+
+    def __init__(self, credentials, name, version, api_endpoint=None,
+                 transport=None):
+        self.credentials = credentials
+        http = transport.build_http() if transport else build_http()
+        self.http = AuthorizedHttp(credentials, http=http)
+        client_options = None
+        if api_endpoint:
+            client_options = {'api_endpoint': api_endpoint}
+        # discovery document is shipped with google API client
+        self.service = build(
+            name, version, http=self.http, client_options=client_options,
+            static_discovery=True)
+        self.resources = {}
+
+    def get_resource(self, name):
+        resource = self.resources.get(name)
+        if resource is None:
+            resource = self.resources[name] = getattr(self.service, name)()
+        return resource
+
+    def spreadsheets(self):
+        return self.get_resource('spreadsheets')
+
+    def files(self):
+        return self.get_resource('files')
+
+    def close(self):
+        self.http.close()
+
+
+def get_service(credentials, name, version, api_endpoint=None,
+                transport=None):
+    """Service of current thread, built again if credentials are changed."""
+    services = getattr(_local, 'services', None)
+    if services is None:
+        services = _local.services = {}
+    key = (name, version, api_endpoint, transport)
+    service = services.get(key)
+    if service is None or service.credentials is not credentials:
+        if service is not None:
+            service.close()
+        service = services[key] = Service(
+            credentials, name, version, api_endpoint, transport)
+    return service
@@ -0,0 +1,90 @@
+"""
+On-disk snapshots of cached tables, shared by all worker processes of a
+host.
+
+Every table version is written to a file, named by sheet id and version,
+so workers load tables from local disk instead of shared cache. Files are
+read through mmap, so their data is kept once in page cache of the host,
+and survive restarts of workers. The latest file of a table is also last
+known good version of it, if shared cache is not available.
+"""
+import glob
+import logging
+import mmap
+import os
+import tempfile
+
+logger = logging.getLogger('sheets_db')
+
+SUFFIX = '.snapshot'
+
+
+def get_path(directory, prefix, version):
+    return os.path.join(directory, f'{prefix}_{version}{SUFFIX}')
+
+
+def read(directory, prefix, version):
+    """
+    Data of the table version as read only mmap, to be closed by caller.
+    None if there is no snapshot.
+    """
+    try:
+        with open(get_path(directory, prefix, version), 'rb') as file:
+            return mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError):
+        # ValueError is raised for empty file
+        return None
+
+
+def write(directory, prefix, version, data):
+    """
+    Write snapshot of the table version atomically, removing snapshots of
+    older versions.
+    """
+    try:
+        os.makedirs(directory, exist_ok=True)
+        with tempfile.NamedTemporaryFile(
+                dir=directory, prefix=prefix, suffix='.tmp',
+                delete=False) as file:
+            file.write(data)
+        path = get_path(directory, prefix, version)
+        os.replace(file.name, path)
+    except OSError as e:
+        logger.warning(f'Snapshot {prefix} not written: {e}')
+        return
+    for old_path in glob.glob(get_path(
+            glob.escape(directory), glob.escape(prefix), '*')):
+        if old_path != path:
+            try:
+                os.remove(old_path)
+            except OSError:
+                pass
+
+
+def get_mtime(path):
+    try:
+        return os.path.getmtime(path)
+    except OSError:
+        # removed by other worker
+        return 0
+
+
+def read_latest(directory, prefix):
+    """
+    Return version and data of the latest snapshot of tables matching
+    prefix, for every table. Used when shared cache is not available.
+    """
+    paths = glob.glob(os.path.join(
+        glob.escape(directory), glob.escape(prefix) + '*' + SUFFIX))
+    paths.sort(key=get_mtime)
+    latest = {}
+    for path in paths:
+        table_prefix, version = os.path.basename(path)[
+            :-len(SUFFIX)].rsplit('_', 1)
+        latest[table_prefix] = version
+    results = []
+    for table_prefix, version in latest.items():
+        data = read(directory, table_prefix, version)
+        if data is not None:
+            results.append((version, data))
+    return results
@@ -0,0 +1,168 @@
+"""
+Record and replay of google API responses.
+
+With RECORD_DIR option every response of google API is written to the
+directory with time it took. With REPLAY_DIR option responses are served
+from the directory instead of network, without delay or with recorded one
+if REPLAY_LATENCY option is set, so benchmarks and load tests run against
+copy of real spreadsheet offline.
+
+Requests are matched by method, path with query and body, host is ignored,
+so responses recorded from google are replayed for any API_ENDPOINT.
+Responses of repeated requests are replayed in recorded order, the last one
+is repeated after that.
+"""
+import collections
+import glob
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from urllib import parse
+
+import httplib2
+from googleapiclient.http import build_http
+
+logger = logging.getLogger('sheets_db')
+
+
+def get_key(method, uri, body):
+    """Digest of request, independent of API host."""
+    url = parse.urlsplit(uri)
+    if isinstance(body, str):
+        body = body.encode()
+    digest = hashlib.sha1(f'{method} {url.path}?{url.query}\n'.encode())
+    digest.update(body or b'')
+    return digest.hexdigest()
+
+
+def get_path(directory, key, number):
+    return os.path.join(directory, f'{key}_{number}')
+
+
+class Transport:
+    """Source of http clients of google API services."""
+    # responses are served without network and credentials
+    offline = False
+
+    def build_http(self):
+        return build_http()
+
+
+class Recorder(Transport):
+    """Records responses of google API to directory."""
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.numbers = collections.Counter()
+        self.lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def build_http(self):
+        return RecordingHttp(self, build_http())
+
+    def record(self, method, uri, body, response, content, elapsed):
+        key = get_key(method, uri, body)
+        with self.lock:
+            number = self.numbers[key]
+            self.numbers[key] += 1
+        path = get_path(self.directory, key, number)
+        with open(path + '.body', 'wb') as file:
+            file.write(content)
+        with open(path + '.json', 'w') as file:
+            json.dump({
+                'method': method,
+                'uri': uri,
+                'response': dict(response),
+                'elapsed': elapsed,
+            }, file, indent=2)
+
+
+class RecordingHttp:
+    """Http client, passing responses of wrapped client to recorder."""
+
+    def __init__(self, recorder, http):
+        self.recorder = recorder
+        self.http = http
+
+    def request(self, uri, method='GET', body=None, headers=None, **kwargs):
+        start = time.perf_counter()
+        response, content = self.http.request(
+            uri, method=method, body=body, headers=headers, **kwargs)
+        self.recorder.record(
+            method, uri, body, response, content,
+            time.perf_counter() - start)
+        return response, content
+
+    def __getattr__(self, name):
+        return getattr(self.http, name)
+
+
+class Replayer(Transport):
+    """Serves responses recorded to directory."""
+    offline = True
+
+    def __init__(self, directory, latency=False):
+        self.directory = directory
+        self.latency = latency
+        self.numbers = collections.Counter()
+        self.lock = threading.Lock()
+
+    def build_http(self):
+        return ReplayHttp(self)
+
+    def replay(self, method, uri, body):
+        """Return recorded response, content and time of the request."""
+        key = get_key(method, uri, body)
+        with self.lock:
+            number = self.numbers[key]
+            self.numbers[key] += 1
+        path = get_path(self.directory, key, number)
+        if not os.path.exists(path + '.json'):
+            # the last response is repeated
+            count = len(glob.glob(
+                get_path(glob.escape(self.directory), key, '*') + '.json'))
+            if not count:
+                logger.warning(f'No recorded response of {method} {uri}')
+                content = json.dumps({'error': {
+                    'code': 404, 'message': 'No recorded response'}})
+                return httplib2.Response({'status': 404}), \
+                    content.encode(), 0.0
+            path = get_path(self.directory, key, count - 1)
+        with open(path + '.json') as file:
+            record = json.load(file)
+        with open(path + '.body', 'rb') as file:
+            content = file.read()
+        return httplib2.Response(record['response']), content, \
+            record['elapsed']
+
+
+class ReplayHttp:
+    """Http client, serving recorded responses."""
+    timeout = None
+    follow_redirects = True
+    redirect_codes = frozenset()
+
+    def __init__(self, replayer):
+        self.replayer = replayer
+        self.connections = {}
+
+    def request(self, uri, method='GET', body=None, headers=None, **kwargs):
+        response, content, elapsed = self.replayer.replay(method, uri, body)
+        if self.replayer.latency:
+            time.sleep(elapsed)
+        return response, content
+
+    def close(self):
+        pass
+
+
+def get_transport(record_dir=None, replay_dir=None, replay_latency=False):
+    """Transport set by options, None for plain network access."""
+    if replay_dir:
+        return Replayer(replay_dir, replay_latency)
+    if record_dir:
+        return Recorder(record_dir)
+    return None
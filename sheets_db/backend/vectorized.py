@@ -0,0 +1,234 @@
+"""
+Vectorized execution of queries with numpy.
+
+Table columns are converted to numpy arrays once per table version and
+lookups are evaluated as boolean masks over the whole base table.
+Expressions, that can't be evaluated this way, raise NotVectorizable and
+are evaluated by row engine.
+"""
+import functools
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+class NotVectorizable(Exception):
+    pass
+
+
+class Vector:
+    """
+    Values of expression for all rows of base table. Numbers are kept as
+    float array with NaN for NULLs, strings as unicode array with empty
+    string for not strings.
+    """
+    def __init__(self, nulls, numbers=None):
+        self.nulls = nulls
+        self._numbers = numbers
+
+    @property
+    def numbers(self):
+        if self._numbers is None:
+            raise NotVectorizable('Not a numeric column')
+        return self._numbers
+
+    @property
+    def strings(self):
+        raise NotVectorizable('Not a string column')
+
+    @property
+    def is_string(self):
+        return numpy.zeros(len(self.nulls), dtype=bool)
+
+
+class Column(Vector):
+    def __init__(self, values):
+        self.values = values
+        nulls = numpy.fromiter(
+            (value is None for value in values), bool, len(values))
+        numbers = None
+        if all(is_number(value) for value in values if value is not None):
+            numbers = numpy.array(
+                [numpy.nan if value is None else value for value in values],
+                dtype=float)
+        super(Column, self).__init__(nulls, numbers)
+
+    @functools.cached_property
+    def is_string(self):
+        return numpy.fromiter(
+            (isinstance(value, str) for value in self.values), bool,
+            len(self.values))
+
+    @functools.cached_property
+    def strings(self):
+        if not self.is_string.any():
+            raise NotVectorizable('Not a string column')
+        return numpy.array(
+            [value if isinstance(value, str) else ''
+             for value in self.values], dtype=str)
+
+    @functools.cached_property
+    def lower_strings(self):
+        return numpy.char.lower(self.strings)
+
+
+def is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def get_column(table, number, kind=None):
+    """Column of table as arrays, cached with table data."""
+    columns = table.derived.setdefault('vectorized', {})
+    column = columns.get((number, kind))
+    if column is None:
+        column = columns[number, kind] = Column(
+            table.get_column(number, kind))
+    return column
+
+
+def row_ids(table):
+    return Vector(
+        numpy.zeros(table.row_count, dtype=bool),
+        numpy.arange(table.row_count, dtype=float))
+
+
+def combine(connector, lhs, rhs):
+    """Arithmetic of vectors or vector and constant."""
+    if connector not in ARITHMETIC:
+        raise NotVectorizable(f'Operation {connector} not vectorizable')
+    if isinstance(rhs, Vector):
+        nulls = lhs.nulls | rhs.nulls
+        rhs = rhs.numbers
+    elif is_number(rhs):
+        if connector == '/' and rhs == 0:
+            raise NotVectorizable('Division by zero')
+        nulls = lhs.nulls
+    else:
+        raise NotVectorizable(f'Value {rhs} is not a number')
+    if connector == '/' and isinstance(rhs, numpy.ndarray):
+        raise NotVectorizable('Division by column')
+    return Vector(nulls, ARITHMETIC[connector](lhs.numbers, rhs))
+
+
+def lookup(lookup_name, lhs, rhs):
+    """Boolean mask of rows matching lookup."""
+    if lookup_name == 'isnull':
+        return lhs.nulls if rhs else ~lhs.nulls
+    if isinstance(rhs, Vector):
+        if lookup_name not in COMPARISONS:
+            raise NotVectorizable(f'Lookup {lookup_name} of two columns')
+        mask = COMPARISONS[lookup_name](lhs.numbers, rhs.numbers)
+        return mask & ~lhs.nulls & ~rhs.nulls
+    if lookup_name in COMPARISONS:
+        if is_number(rhs):
+            return COMPARISONS[lookup_name](lhs.numbers, rhs) & ~lhs.nulls
+        if isinstance(rhs, str) and lookup_name == 'exact':
+            return (lhs.strings == rhs) & lhs.is_string
+        raise NotVectorizable(f'Lookup {lookup_name} of {rhs}')
+    if lookup_name == 'range':
+        if not all(is_number(value) for value in rhs):
+            raise NotVectorizable(f'Range of {rhs}')
+        numbers = lhs.numbers
+        return (numbers >= rhs[0]) & (numbers <= rhs[1]) & ~lhs.nulls
+    if lookup_name == 'in':
+        values = list(rhs)
+        if all(is_number(value) for value in values):
+            return numpy.isin(lhs.numbers, values) & ~lhs.nulls
+        if all(isinstance(value, str) for value in values):
+            return numpy.isin(lhs.strings, values) & lhs.is_string
+        raise NotVectorizable(f'In of mixed values {rhs}')
+    if lookup_name in STRING_LOOKUPS and isinstance(rhs, str):
+        if not isinstance(lhs, Column):
+            raise NotVectorizable('String lookup of expression')
+        if lookup_name.startswith('i'):
+            strings, rhs = lhs.lower_strings, rhs.lower()
+        else:
+            strings = lhs.strings
+        if lookup_name.endswith('exact'):
+            mask = strings == rhs
+        elif lookup_name.endswith('contains'):
+            mask = numpy.char.find(strings, rhs) >= 0
+        elif lookup_name.endswith('startswith'):
+            mask = numpy.char.startswith(strings, rhs)
+        else:
+            mask = numpy.char.endswith(strings, rhs)
+        return mask & lhs.is_string
+    raise NotVectorizable(f'Lookup {lookup_name} not vectorizable')
+
+
+def group_reduce(column, groups, reduction):
+    """
+    Reduce values of the column for every group of row ids. Return list of
+    results in groups order.
+    """
+    if not groups:
+        return []
+    lengths = numpy.fromiter((len(ids) for ids in groups), int, len(groups))
+    ids = numpy.fromiter(
+        (row_id for ids in groups for row_id in ids), int, lengths.sum())
+    codes = numpy.repeat(numpy.arange(len(groups)), lengths)
+    valid = ~column.nulls[ids]
+    counts = numpy.bincount(
+        codes, weights=valid, minlength=len(groups)).astype(int)
+    if reduction == 'count':
+        return counts.tolist()
+    numbers = column.numbers[ids]
+    if reduction in ('sum', 'avg'):
+        sums = numpy.bincount(
+            codes[valid], weights=numbers[valid], minlength=len(groups))
+        results = sums if reduction == 'sum' else sums / numpy.maximum(
+            counts, 1)
+    else:
+        # reduceat can't reduce empty groups, their result is NULL anyway
+        starts = numpy.concatenate(([0], numpy.cumsum(lengths)[:-1]))
+        filled = lengths > 0
+        function = numpy.fmin if reduction == 'min' else numpy.fmax
+        results = numpy.full(len(groups), numpy.nan)
+        if filled.any():
+            results[filled] = function.reduceat(numbers, starts[filled])
+    return [
+        result if count else None
+        for result, count in zip(results.tolist(), counts.tolist())]
+
+
+def reduce_masks(is_and, masks, negated, size):
+    if not masks:
+        mask = numpy.full(size, is_and)
+    elif is_and:
+        mask = numpy.logical_and.reduce(masks)
+    else:
+        mask = numpy.logical_or.reduce(masks)
+    return ~mask if negated else mask
+
+
+def nonzero(mask):
+    return numpy.flatnonzero(mask).tolist()
+
+
+def select(rows, mask):
+    """Rows matching mask, keeping their order."""
+    rows = numpy.fromiter(rows, int)
+    return rows[mask[rows]].tolist()
+
+
+ARITHMETIC = {
+    '+': numpy.add,
+    '-': numpy.subtract,
+    '*': numpy.multiply,
+    '/': numpy.true_divide,
+} if numpy else {}
+
+COMPARISONS = {
+    'exact': numpy.equal,
+    'lt': numpy.less,
+    'lte': numpy.less_equal,
+    'gt': numpy.greater,
+    'gte': numpy.greater_equal,
+} if numpy else {}
+
+STRING_LOOKUPS = {
+    'iexact', 'contains', 'icontains', 'startswith', 'istartswith',
+    'endswith', 'iendswith',
+}
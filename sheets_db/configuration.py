@@ -1,12 +1,17 @@
 import google_auth_oauthlib.flow
 
+from asgiref.sync import sync_to_async
 from django.db import DEFAULT_DB_ALIAS, connections
 from django.core import exceptions
 
 from sheets_db.backend import base
 
 
-GOOGLE_SCOPES = ['https://www.googleapis.com/auth/spreadsheets']
+GOOGLE_SCOPES = [
+    'https://www.googleapis.com/auth/spreadsheets',
+    # modification time is used to skip refetch of not changed spreadsheet
+    'https://www.googleapis.com/auth/drive.metadata.readonly',
+]
 
 
 def _get_flow(alias):
@@ -41,3 +46,14 @@ def configure_db(request, alias=DEFAULT_DB_ALIAS, callback_uri=None):
     db_backend = connections[alias]
     db_backend.ensure_connection()
     db_backend.connection.configure(flow.credentials)
+
+
+async def aget_tables(table_names=None, alias=DEFAULT_DB_ALIAS):
+    """
+    Load tables from async view without blocking event loop. Loaded tables
+    are cached, so ORM queries of the view, run with sync_to_async, don't
+    wait for google.
+    """
+    db_backend = connections[alias]
+    await sync_to_async(db_backend.ensure_connection, thread_sensitive=False)()
+    return await db_backend.connection.aget_tables(table_names)
@@ -0,0 +1,85 @@
+import logging
+import random
+import time
+
+from django.core.management import base as management
+from django.db import connections
+
+from sheets_db.backend import base
+
+logger = logging.getLogger('sheets_db')
+
+JITTER = 0.1
+
+
+def jitter(delay):
+    return delay * random.uniform(1 - JITTER, 1 + JITTER)
+
+
+class Command(management.BaseCommand):
+    help = (
+        'Keep cache of sheets databases warm, refreshing tables before they '
+        'expire, so requests never wait for google.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--database', action='append', dest='databases',
+            help='Database alias to refresh, all sheets databases if not set.')
+        parser.add_argument(
+            '--interval', type=float, default=60,
+            help='Seconds between checks of tables expiration.')
+        parser.add_argument(
+            '--ahead', type=float, default=None,
+            help='Refresh tables expiring in this number of seconds, '
+                 'two intervals by default.')
+        parser.add_argument(
+            '--max-backoff', type=float, default=60 * 60,
+            help='Max delay between retries after google API errors.')
+        parser.add_argument(
+            '--all', action='store_true', dest='load_all',
+            help='Load also tables, that were never used by queries.')
+        parser.add_argument(
+            '--once', action='store_true',
+            help='Refresh once and exit.')
+
+    def handle(self, *args, **options):
+        aliases = options['databases'] or [
+            alias for alias in connections
+            if isinstance(connections[alias], base.DatabaseWrapper)]
+        if not aliases:
+            raise management.CommandError('No sheets databases configured')
+        interval = options['interval']
+        ahead = options['ahead'] or interval * 2
+        errors = {alias: 0 for alias in aliases}
+        next_run = {alias: 0 for alias in aliases}
+        while True:
+            for alias in aliases:
+                if next_run[alias] > time.monotonic():
+                    continue
+                try:
+                    self.refresh(alias, ahead, options['load_all'])
+                except Exception:
+                    errors[alias] += 1
+                    delay = min(
+                        options['max_backoff'],
+                        interval * 2 ** errors[alias])
+                    logger.exception(
+                        f'Refresh of {alias} failed, retry in {delay}s')
+                else:
+                    errors[alias] = 0
+                    delay = interval
+                next_run[alias] = time.monotonic() + jitter(delay)
+            if options['once']:
+                return
+            time.sleep(max(0, min(next_run.values()) - time.monotonic()))
+
+    def refresh(self, alias, ahead, load_all):
+        db_backend = connections[alias]
+        db_backend.ensure_connection()
+        connection = db_backend.connection
+        if not connection.configured:
+            logger.warning(f'Sheets DB {alias} not configured, skip refresh')
+            return
+        refreshed = connection.refresh_expiring(ahead, load_all)
+        if refreshed:
+            self.stdout.write(f'{alias}: {refreshed} tables refreshed')